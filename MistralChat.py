@@ -1,16 +1,25 @@
 # app.py
 import streamlit as st
-from mistralai.client import MistralClient
 from mistralai.models.chat_completion import ChatMessage
 import logging
 import datetime
+import io
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from streamlit_feedback import streamlit_feedback # Importez le composant
 
 # Importer nos modules locaux
-from utils.config import APP_TITLE, COMMUNE_NAME, MISTRAL_API_KEY
+from utils.config import (
+    APP_TITLE, COMMUNE_NAME, MISTRAL_API_KEY, BATCH_SEARCH_TIMEOUT, HISTORY_RECENT_MESSAGES,
+    CHUNK_SIZE, CONTEXT_MAX_CHARS_PER_DOC, CONTEXT_TOTAL_BUDGET
+)
 from utils.vector_store import VectorStoreManager
+from utils.batched_search import BatchedSearcher
+from utils.context_builder import build_context
 from utils.database import log_interaction, update_feedback # Importez update_feedback
 from utils.query_classifier import QueryClassifier
+from utils.semantic_cache import SemanticCache
+from utils.singletons import get_or_create
+from utils import mistral_async
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -21,33 +30,101 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Initialisation (avec mise en cache Streamlit) ---
-
-# Met en cache le VectorStoreManager pour éviter de recharger l'index à chaque interaction
-@st.cache_resource
-def get_vector_store():
-    logging.info("Chargement du VectorStoreManager...")
-    return VectorStoreManager()
-
-# Met en cache le client Mistral
-@st.cache_resource
-def get_mistral_client():
-    if not MISTRAL_API_KEY:
-        st.error("Erreur: La clé API Mistral (MISTRAL_API_KEY) n'est pas configurée.")
-        st.stop()
-    logging.info("Initialisation du client Mistral...")
-    return MistralClient(api_key=MISTRAL_API_KEY)
-
-# Met en cache le classificateur de requêtes
-@st.cache_resource
-def get_query_classifier():
-    logging.info("Initialisation du classificateur de requêtes...")
-    return QueryClassifier()
-
-# Charge le Vector Store, le client Mistral et le classificateur de requêtes
-vector_store = get_vector_store()
-client = get_mistral_client()
-query_classifier = get_query_classifier()
+# --- Initialisation (objets partagés entre les sessions et les re-exécutions) ---
+
+# Vérifie la présence de la clé API avant tout appel à l'API Mistral
+if not MISTRAL_API_KEY:
+    st.error("Erreur: La clé API Mistral (MISTRAL_API_KEY) n'est pas configurée.")
+    st.stop()
+
+# Charge le Vector Store (index Faiss chargé une seule fois),
+# le classificateur de requêtes, le cache sémantique et le regroupeur de recherches Faiss
+vector_store = get_or_create("vector_store", VectorStoreManager)
+query_classifier = get_or_create("query_classifier", lambda: QueryClassifier(vector_store))
+semantic_cache = get_or_create("semantic_cache", SemanticCache)
+batched_search = get_or_create("batched_search", lambda: BatchedSearcher(vector_store))
+# Pool de threads dédié aux écritures en base de données (hors du chemin critique)
+db_executor = get_or_create("db_executor", lambda: ThreadPoolExecutor(max_workers=2, thread_name_prefix="db-writer"))
+# Pool de threads partagé pour exécuter la classification et la recherche en parallèle
+pipeline_executor = get_or_create("pipeline_executor", lambda: ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-pipeline"))
+
+# --- Préparation du prompt système ---
+# Les parties fixes des prompts (dont le nom de la commune) sont construites une seule fois
+# au chargement; seul le contexte est substitué à chaque tour
+
+# Prompt système pour le mode RAG (le contexte est injecté dans {context})
+SYSTEM_PROMPT_RAG_TEMPLATE = f"""Vous êtes un assistant virtuel pour {COMMUNE_NAME}.
+Répondez à la question de l'utilisateur en vous basant UNIQUEMENT sur le contexte fourni ci-dessous.
+Si l'information n'est pas dans le contexte, dites que vous ne savez pas ou que l'information n'est pas disponible dans les documents fournis.
+Soyez concis et précis. Citez vos sources si possible (par exemple, en mentionnant le nom du fichier ou la catégorie trouvée dans les métadonnées).
+
+Contexte fourni:
+---
+{{context}}
+---
+"""
+
+# Prompt système pour le mode RAG sans résultats
+SYSTEM_PROMPT_RAG_EMPTY = f"""Vous êtes un assistant virtuel pour {COMMUNE_NAME}.
+L'utilisateur a posé une question qui semble concerner des informations spécifiques à la commune, mais aucune information pertinente n'a été trouvée dans notre base de connaissances.
+Indiquez poliment que vous n'avez pas cette information spécifique et suggérez à l'utilisateur de reformuler sa question ou de contacter directement la mairie.
+N'inventez pas d'informations sur {COMMUNE_NAME}.
+"""
+
+# Prompt système pour le mode Direct
+SYSTEM_PROMPT_DIRECT = f"""Vous êtes un assistant virtuel pour {COMMUNE_NAME}.
+Répondez à la question de l'utilisateur en utilisant vos connaissances générales.
+Soyez concis, précis et utile.
+Si la question concerne des informations spécifiques à {COMMUNE_NAME} que vous ne connaissez pas, indiquez clairement que vous n'avez pas cette information spécifique.
+N'inventez pas d'informations sur {COMMUNE_NAME}.
+"""
+
+def preparer_prompt_systeme(needs_rag: bool, retrieved_docs: list, max_chars_per_doc: int, context_budget: int):
+    """Construit le prompt système et les sources à enregistrer en fonction du mode.
+
+    Args:
+        needs_rag: True si la requête nécessite une recherche dans la base de connaissances
+        retrieved_docs: Chunks retournés par la recherche (vide en mode direct)
+        max_chars_per_doc: Nombre maximum de caractères conservés par chunk dans le contexte
+        context_budget: Nombre maximum de caractères de texte pour l'ensemble du contexte
+
+    Returns:
+        Tuple (sources_for_log, system_prompt)
+    """
+    if needs_rag and retrieved_docs:
+        # Mode RAG avec documents trouvés
+        logging.info(f"{len(retrieved_docs)} documents récupérés.")
+        # Préparer le contexte pour le LLM (doublons écartés, texte tronqué selon le budget)
+        # Les embeddings des chunks sont relus depuis l'index, sans appel à l'API
+        doc_embeddings = vector_store.get_chunk_embeddings([doc["chunk_index"] for doc in retrieved_docs])
+        context_str, context_docs = build_context(
+            retrieved_docs,
+            embeddings=doc_embeddings,
+            max_chars_per_doc=max_chars_per_doc,
+            total_budget=context_budget
+        )
+        sources_for_log = [ # Version simplifiée pour l'affichage (extrait calculé une seule fois)
+            {"text": doc["text"], "excerpt": doc["text"][:500] + "...", "metadata": doc["metadata"], "score": doc["score"]}
+            for doc in context_docs
+        ]
+        return sources_for_log, SYSTEM_PROMPT_RAG_TEMPLATE.format(context=context_str)
+    elif needs_rag and not retrieved_docs:
+        # Mode RAG mais aucun document trouvé
+        logging.warning("Aucun document pertinent trouvé.")
+        return [], SYSTEM_PROMPT_RAG_EMPTY
+    else:
+        # Mode Direct (sans RAG)
+        return [], SYSTEM_PROMPT_DIRECT
+
+# --- Export de la conversation ---
+def construire_transcription(messages: list) -> str:
+    """Construit le texte de la conversation (sans en-tête) pour le téléchargement."""
+    buffer = io.StringIO()
+    for i, msg in enumerate(messages):
+        if i:
+            buffer.write("\n\n")
+        buffer.write(f"{'Utilisateur' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}")
+    return buffer.getvalue()
 
 # Initialise l'historique du chat dans l'état de la session s'il n'existe pas
 if "messages" not in st.session_state:
@@ -55,6 +132,9 @@ if "messages" not in st.session_state:
 # Initialise l'ID de la dernière interaction pour le feedback
 if "last_interaction_id" not in st.session_state:
     st.session_state.last_interaction_id = None
+# Initialise la position de la dernière réponse de l'assistant dans l'historique
+if "last_assistant_idx" not in st.session_state:
+    st.session_state.last_assistant_idx = None
 
 # --- Interface Utilisateur ---
 
@@ -68,6 +148,8 @@ with st.sidebar:
         # Réinitialiser l'historique des messages
         st.session_state.messages = []
         st.session_state.last_interaction_id = None
+        st.session_state.last_assistant_idx = None
+        st.session_state.transcript_cache = None
         st.rerun()  # Recharger l'application pour afficher la nouvelle conversation
 
     st.divider()
@@ -96,6 +178,22 @@ with st.sidebar:
         step=1
     )
 
+    # Sliders pour la taille du contexte envoyé au LLM
+    max_chars_per_doc = st.slider(
+        "Caractères max par document",
+        min_value=200,
+        max_value=CHUNK_SIZE,
+        value=CONTEXT_MAX_CHARS_PER_DOC,
+        step=100
+    )
+    context_budget = st.slider(
+        "Budget total du contexte (caractères)",
+        min_value=1000,
+        max_value=20000,
+        value=CONTEXT_TOTAL_BUDGET,
+        step=500
+    )
+
     # Slider pour le score minimum (en pourcentage)
     min_score_percent = st.slider(
         "Score minimum (filtrer les résultats faibles)",
@@ -121,21 +219,24 @@ with st.sidebar:
 
         # Bouton pour télécharger la conversation
         # Préparer le contenu de la conversation au format texte
-        conversation_text = "\n\n".join([
-            f"{'Utilisateur' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-            for msg in st.session_state.messages
-        ])
+        # (reconstruit uniquement lorsque de nouveaux messages ont été ajoutés)
+        nb_messages = len(st.session_state.messages)
+        transcript_cache = st.session_state.get("transcript_cache")
+        if transcript_cache is None or transcript_cache[0] != nb_messages:
+            transcript_cache = (nb_messages, construire_transcription(st.session_state.messages))
+            st.session_state.transcript_cache = transcript_cache
 
         # Ajouter un en-tête avec la date et le titre
+        now = datetime.datetime.now()
         header = f"Conversation avec l'assistant virtuel de {COMMUNE_NAME}\n"
-        header += f"Date: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
-        conversation_text = header + conversation_text
+        header += f"Date: {now.strftime('%d/%m/%Y %H:%M')}\n\n"
+        conversation_text = header + transcript_cache[1]
 
         # Bouton de téléchargement
         st.download_button(
             label="💾 Télécharger la conversation",
             data=conversation_text,
-            file_name=f"conversation_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.txt",
+            file_name=f"conversation_{now.strftime('%Y%m%d_%H%M')}.txt",
             mime="text/plain",
             use_container_width=True
         )
@@ -144,28 +245,54 @@ with st.sidebar:
 st.title(f"📚 {APP_TITLE}")
 st.caption(f"Posez vos questions sur {COMMUNE_NAME}")
 
-# Affichage de l'historique du chat
-for message in st.session_state.messages:
+# --- Affichage de l'historique du chat ---
+def afficher_sources(sources: list, key_prefix: str):
+    """Affiche le détail des sources utilisées pour une réponse."""
+    for i, source in enumerate(sources):
+        # Accès sécurisé aux métadonnées
+        meta = source.get("metadata", {})
+        st.markdown(f"**Source {i+1}:** `{meta.get('source', 'N/A')}`")
+        st.markdown(f"*Score de similarité:* {source.get('score', 0.0):.2f}%")
+        if 'raw_score' in source:
+            st.markdown(f"*Score brut:* {source.get('raw_score', 0.0):.4f}")
+        st.markdown(f"*Catégorie:* `{meta.get('category', 'N/A')}`")
+        st.text_area(f"Extrait {i+1}", value=source["excerpt"], height=100, disabled=True, key=f"{key_prefix}_{i}") # Clé unique pour éviter les conflits
+
+def afficher_message(message: dict, compact: bool = False):
+    """Affiche un message de l'historique.
+
+    Args:
+        message: Message de l'historique (role, content, sources...)
+        compact: True pour n'afficher que le nom des sources (les expanders ne peuvent pas être imbriqués)
+    """
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         # Afficher les sources si elles existent pour les messages de l'assistant
-        if message["role"] == "assistant" and "sources" in message and message["sources"]:
-            with st.expander("Sources utilisées"):
-                for i, source in enumerate(message["sources"]):
-                    # Accès sécurisé aux métadonnées
-                    meta = source.get("metadata", {})
-                    st.markdown(f"**Source {i+1}:** `{meta.get('source', 'N/A')}`")
-                    st.markdown(f"*Score de similarité:* {source.get('score', 0.0):.2f}%")
-                    if 'raw_score' in source:
-                        st.markdown(f"*Score brut:* {source.get('raw_score', 0.0):.4f}")
-                    st.markdown(f"*Catégorie:* `{meta.get('category', 'N/A')}`")
-                    st.text_area(f"Extrait {i+1}", value=source.get("text", "")[:500]+"...", height=100, disabled=True, key=f"src_{message['timestamp']}_{i}") # Clé unique pour éviter les conflits
+        if message["role"] == "assistant" and message.get("sources"):
+            if compact:
+                st.caption("Sources: " + ", ".join(f"`{source.get('metadata', {}).get('source', 'N/A')}`" for source in message["sources"]))
+            else:
+                with st.expander("Sources utilisées"):
+                    afficher_sources(message["sources"], key_prefix=f"src_{message['timestamp']}")
+
+# Seuls les derniers messages sont affichés en détail; les plus anciens sont regroupés
+# dans un expander replié pour limiter le coût de rendu des longues conversations
+older_messages = st.session_state.messages[:-HISTORY_RECENT_MESSAGES]
+recent_messages = st.session_state.messages[-HISTORY_RECENT_MESSAGES:]
+if older_messages:
+    with st.expander(f"{len(older_messages)} messages précédents", expanded=False):
+        for message in older_messages:
+            afficher_message(message, compact=True)
+for message in recent_messages:
+    afficher_message(message)
 
 
 # Zone de saisie utilisateur en bas
 if prompt := st.chat_input("Posez votre question ici..."):
     # Ajouter le message utilisateur à l'historique et l'afficher
-    st.session_state.messages.append({"role": "user", "content": prompt, "timestamp": datetime.datetime.now().isoformat()})
+    # Un seul horodatage par tour, partagé par les messages utilisateur et assistant
+    turn_timestamp = datetime.datetime.now().isoformat()
+    st.session_state.messages.append({"role": "user", "content": prompt, "timestamp": turn_timestamp})
     with st.chat_message("user"):
         st.markdown(prompt)
 
@@ -176,124 +303,120 @@ if prompt := st.chat_input("Posez votre question ici..."):
 
         # --- Logique de traitement de la requête ---
         try:
-            # 1. Classifier la requête pour déterminer si elle nécessite RAG
-            needs_rag, confidence, reason = query_classifier.needs_rag(prompt)
-
-            # Afficher le résultat de la classification
-            mode_str = "RAG" if needs_rag else "DIRECT"
-            logging.info(f"Classification de la requête: {mode_str} (confiance: {confidence:.2f}) - Raison: {reason}")
-
-            # Afficher un message indiquant le mode utilisé
-            mode_info = st.empty()
-            if needs_rag:
-                mode_info.info(f"Mode RAG: Recherche d'informations spécifiques dans la base de connaissances (confiance: {confidence:.2f})")
-                # 2. Recherche dans le Vector Store si nécessaire
-                logging.info(f"Recherche de documents pour: '{prompt}' (max: {num_docs}, score min: {min_score})")
-                retrieved_docs = vector_store.search(prompt, k=num_docs, min_score=min_score)
+            # 0. Vérifier le cache sémantique (requête identique, puis requête similaire)
+            # Une réponse n'est réutilisée que si elle a été générée avec les mêmes paramètres
+            cache_settings = (selected_model, num_docs, min_score, max_chars_per_doc, context_budget)
+            cached = semantic_cache.lookup(prompt, settings=cache_settings)
+            query_embedding = None
+            if cached is None:
+                # L'embedding de la requête est calculé une seule fois et réutilisé pour la recherche
+                query_embedding = vector_store.embed_query(prompt)
+                cached = semantic_cache.lookup(prompt, query_embedding, settings=cache_settings)
+            from_cache = cached is not None
+
+            if from_cache:
+                # Réponse déjà connue: pas de classification, de recherche ni d'appel au LLM
+                response_text, sources_for_log = cached
+                needs_rag = bool(sources_for_log)
+                confidence = 1.0
+                reason = "Réponse servie depuis le cache sémantique"
+                logging.info("Réponse servie depuis le cache sémantique.")
+                st.empty().info("Mode Cache: Réponse à une question similaire déjà posée")
             else:
-                mode_info.info(f"Mode Direct: Réponse basée sur les connaissances générales du modèle (confiance: {confidence:.2f})")
-                # Pas de recherche dans le Vector Store
-                retrieved_docs = []
-
-            # 2. Préparer les données en fonction du mode
-            if needs_rag and retrieved_docs:
-                # Mode RAG avec documents trouvés
-                logging.info(f"{len(retrieved_docs)} documents récupérés.")
-                # Préparer le contexte pour le LLM
-                context_str = "\n\n---\n\n".join([
-                    f"Source: {doc['metadata'].get('source', 'Inconnue')} (Score: {doc['score']:.4f})\nContenu: {doc['text']}"
-                    for doc in retrieved_docs
-                ])
-                sources_for_log = [ # Version simplifiée pour le log et l'affichage
-                    {"text": doc["text"], "metadata": doc["metadata"], "score": doc["score"]}
-                    for doc in retrieved_docs
-                ]
-
-                # Prompt système pour le mode RAG
-                system_prompt = f"""Vous êtes un assistant virtuel pour {COMMUNE_NAME}.
-Répondez à la question de l'utilisateur en vous basant UNIQUEMENT sur le contexte fourni ci-dessous.
-Si l'information n'est pas dans le contexte, dites que vous ne savez pas ou que l'information n'est pas disponible dans les documents fournis.
-Soyez concis et précis. Citez vos sources si possible (par exemple, en mentionnant le nom du fichier ou la catégorie trouvée dans les métadonnées).
-
-Contexte fourni:
----
-{context_str}
----
-"""
-            elif needs_rag and not retrieved_docs:
-                # Mode RAG mais aucun document trouvé
-                logging.warning("Aucun document pertinent trouvé.")
-                context_str = "Aucune information pertinente trouvée dans les documents."
-                sources_for_log = []
-
-                # Prompt système pour le mode RAG sans résultats
-                system_prompt = f"""Vous êtes un assistant virtuel pour {COMMUNE_NAME}.
-L'utilisateur a posé une question qui semble concerner des informations spécifiques à la commune, mais aucune information pertinente n'a été trouvée dans notre base de connaissances.
-Indiquez poliment que vous n'avez pas cette information spécifique et suggérez à l'utilisateur de reformuler sa question ou de contacter directement la mairie.
-N'inventez pas d'informations sur {COMMUNE_NAME}.
-"""
-            else:
-                # Mode Direct (sans RAG)
-                context_str = "Mode direct: réponse basée sur les connaissances générales du modèle."
-                sources_for_log = []
-
-                # Prompt système pour le mode Direct
-                system_prompt = f"""Vous êtes un assistant virtuel pour {COMMUNE_NAME}.
-Répondez à la question de l'utilisateur en utilisant vos connaissances générales.
-Soyez concis, précis et utile.
-Si la question concerne des informations spécifiques à {COMMUNE_NAME} que vous ne connaissez pas, indiquez clairement que vous n'avez pas cette information spécifique.
-N'inventez pas d'informations sur {COMMUNE_NAME}.
-"""
-            user_message = ChatMessage(role="user", content=prompt)
-            system_message = ChatMessage(role="system", content=system_prompt)
-            messages_for_api = [system_message, user_message]
-
-            # 3. Appel à l'API Mistral Chat
-            logging.info(f"Appel de l'API Mistral Chat avec le modèle {selected_model}...")
-            chat_response = client.chat(
-                model=selected_model,
-                messages=messages_for_api
-            )
-            response_text = chat_response.choices[0].message.content
-            logging.info("Réponse générée par Mistral.")
-
-            # 4. Afficher la réponse et les sources
+                # 1. Classifier la requête et lancer la recherche en parallèle
+                # La recherche ne dépend pas de la classification: elle est abandonnée si inutile
+                logging.info(f"Recherche de documents pour: '{prompt}' (max: {num_docs}, score min: {min_score})")
+                f_cls = pipeline_executor.submit(query_classifier.needs_rag, prompt, query_embedding)
+                def rechercher_documents():
+                    # Sonde rapide (k=1): inutile de lancer la recherche complète si aucun chunk n'atteint le score minimum
+                    if query_embedding is not None and vector_store.cheap_probe(query_embedding) < min_score:
+                        logging.info(f"Aucun chunk au-dessus du score minimum ({min_score:.2f}): recherche complète évitée.")
+                        return []
+                    # La recherche est regroupée avec celles des autres sessions en cours
+                    f_search = batched_search.submit(prompt, k=num_docs, min_score=min_score, query_embedding=query_embedding)
+                    try:
+                        return f_search.result(timeout=BATCH_SEARCH_TIMEOUT)
+                    except FuturesTimeoutError:
+                        # Lot en retard: recherche directe plutôt qu'une erreur sans message
+                        f_search.cancel()
+                        logging.warning(f"Recherche groupée non terminée après {BATCH_SEARCH_TIMEOUT}s: recherche directe.")
+                        if query_embedding is None:
+                            logging.error("Recherche directe impossible sans embedding de la requête: aucun document récupéré.")
+                            return []
+                        return vector_store.search_by_embedding(query_embedding, k=num_docs, min_score=min_score)
+
+                f_ret = pipeline_executor.submit(rechercher_documents)
+                needs_rag, confidence, reason = f_cls.result()
+
+                # Afficher le résultat de la classification
+                mode_str = "RAG" if needs_rag else "DIRECT"
+                logging.info(f"Classification de la requête: {mode_str} (confiance: {confidence:.2f}) - Raison: {reason}")
+
+                # Afficher un message indiquant le mode utilisé
+                mode_info = st.empty()
+                if needs_rag:
+                    mode_info.info(f"Mode RAG: Recherche d'informations spécifiques dans la base de connaissances (confiance: {confidence:.2f})")
+                    # 2. Récupérer le résultat de la recherche dans le Vector Store
+                    retrieved_docs = f_ret.result()
+                else:
+                    mode_info.info(f"Mode Direct: Réponse basée sur les connaissances générales du modèle (confiance: {confidence:.2f})")
+                    # Pas besoin de la recherche dans le Vector Store
+                    f_ret.cancel()
+                    retrieved_docs = []
+
+                # 2. Préparer les données en fonction du mode
+                sources_for_log, system_prompt = preparer_prompt_systeme(needs_rag, retrieved_docs, max_chars_per_doc, context_budget)
+                user_message = ChatMessage(role="user", content=prompt)
+                system_message = ChatMessage(role="system", content=system_prompt)
+                messages_for_api = [system_message, user_message]
+
+                # 3. Appel à l'API Mistral Chat en streaming
+                # Les tokens sont affichés au fur et à mesure de leur génération
+                logging.info(f"Appel de l'API Mistral Chat (streaming) avec le modèle {selected_model}...")
+                # Le client HTTP/2 partagé conserve les connexions ouvertes entre les tours
+                response_text = ""
+                for delta in mistral_async.chat_stream(selected_model, messages_for_api):
+                    response_text += delta
+                    message_placeholder.markdown(response_text + "▌") # Curseur pendant la génération
+                logging.info("Réponse générée par Mistral.")
+
+            # 4. Afficher la réponse finale (sans curseur) et les sources
             message_placeholder.markdown(response_text)
 
             # Afficher les sources si disponibles (mode RAG avec résultats)
             if sources_for_log:
                 with st.expander("Sources utilisées"):
-                    for i, source in enumerate(sources_for_log):
-                        meta = source.get("metadata", {})
-                        st.markdown(f"**Source {i+1}:** `{meta.get('source', 'N/A')}`")
-                        st.markdown(f"*Score de similarité:* {source.get('score', 0.0):.2f}%")
-                        if 'raw_score' in source:
-                            st.markdown(f"*Score brut:* {source.get('raw_score', 0.0):.4f}")
-                        st.markdown(f"*Catégorie:* `{meta.get('category', 'N/A')}`")
-                        st.text_area(f"Extrait {i+1}", value=source.get("text", "")[:500]+"...", height=100, disabled=True, key=f"src_new_{i}") # Clé unique
-            elif needs_rag:
+                    afficher_sources(sources_for_log, key_prefix="src_new")
+            elif needs_rag and not from_cache:
                 # Mode RAG sans résultats
                 st.info("Aucune source pertinente n'a été trouvée dans la base de connaissances pour cette question.")
-            else:
-                # Mode Direct
+            elif not from_cache:
+                # Mode Direct (une réponse issue du cache sans source n'affiche rien)
                 st.info("Réponse générée en mode direct, sans consultation de la base de connaissances.")
 
             # 5. Enregistrer l'interaction dans la base de données (sans feedback initial)
             # Ajouter des métadonnées sur le mode utilisé
             metadata = {
-                "mode": "RAG" if needs_rag else "DIRECT",
+                "mode": "CACHE" if from_cache else "RAG" if needs_rag else "DIRECT",
                 "confidence": confidence,
                 "reason": reason
             }
 
-            interaction_id = log_interaction(
+            # Mettre la réponse en cache pour les prochaines requêtes identiques ou similaires
+            if not from_cache:
+                semantic_cache.store(prompt, query_embedding, response_text, sources_for_log, settings=cache_settings)
+
+            # L'écriture en base est faite en arrière-plan: l'ID n'est attendu que par la section feedback
+            interaction_future = db_executor.submit(
+                log_interaction,
                 query=prompt,
                 response=response_text,
-                sources=sources_for_log, # Stocke la liste de dicts
+                sources=[{key: value for key, value in source.items() if key != "text"} for source in sources_for_log], # Seul l'extrait est stocké, pas le texte complet
                 metadata=metadata # Ajouter les métadonnées sur le mode
             )
-            st.session_state.last_interaction_id = interaction_id # Garde l'ID pour le feedback
-            logging.info(f"Interaction enregistrée avec ID: {interaction_id}")
+            interaction_future.add_done_callback(
+                lambda f: logging.info(f"Interaction enregistrée avec ID: {f.result()}") if not f.exception() else None
+            )
 
 
             # Ajouter la réponse de l'assistant à l'historique pour affichage permanent
@@ -301,9 +424,12 @@ N'inventez pas d'informations sur {COMMUNE_NAME}.
                 "role": "assistant",
                 "content": response_text,
                 "sources": sources_for_log, # Garder les sources pour réaffichage
-                "timestamp": datetime.datetime.now().isoformat(),
-                 "interaction_id": interaction_id # Lier le message à l'ID BDD
+                "timestamp": turn_timestamp,
+                "interaction_id": None, # Lien vers l'ID BDD, résolu à partir de _id_future
+                "_id_future": interaction_future,
+                "_cache_entry": (prompt, query_embedding, cache_settings) # Pour retirer la réponse du cache si elle est jugée mauvaise
             })
+            st.session_state.last_assistant_idx = len(st.session_state.messages) - 1
 
 
         except Exception as e:
@@ -315,18 +441,35 @@ N'inventez pas d'informations sur {COMMUNE_NAME}.
                 logging.error(f"Erreur inattendue: {e}", exc_info=True)
                 message_placeholder.error(f"Une erreur s'est produite: {e}")
 
-            st.session_state.messages.append({"role": "assistant", "content": f"Erreur: {e}", "sources": [], "timestamp": datetime.datetime.now().isoformat(), "interaction_id": None})
+            st.session_state.messages.append({"role": "assistant", "content": f"Erreur: {e}", "sources": [], "timestamp": turn_timestamp, "interaction_id": None})
+            st.session_state.last_assistant_idx = len(st.session_state.messages) - 1
             st.session_state.last_interaction_id = None # Pas d'ID si erreur avant log
 
 # --- Section Feedback ---
 # Placer le feedback après la boucle d'affichage et la zone de chat input
 # On cible la *dernière* réponse de l'assistant pour le feedback
-last_assistant_message = next((m for m in reversed(st.session_state.messages) if m["role"] == "assistant"), None)
+# (position mémorisée lors de l'ajout, pour éviter de parcourir tout l'historique)
+last_assistant_idx = st.session_state.last_assistant_idx
+last_assistant_message = st.session_state.messages[last_assistant_idx] if last_assistant_idx is not None else None
 
 # Vérifie si la dernière réponse a un ID d'interaction associé
 current_interaction_id = last_assistant_message.get("interaction_id") if last_assistant_message else None
-
-if current_interaction_id:
+if current_interaction_id is None and last_assistant_message and last_assistant_message.get("_id_future"):
+    # Attendre la fin de l'enregistrement en arrière-plan (déjà terminé dans la plupart des cas)
+    # Le futur est retiré du message: il n'est résolu qu'une fois, même s'il a échoué
+    id_future = last_assistant_message.pop("_id_future")
+    try:
+        current_interaction_id = id_future.result()
+    except Exception as e:
+        logging.error(f"Erreur lors de l'enregistrement de l'interaction en arrière-plan: {e}")
+        current_interaction_id = None
+    last_assistant_message["interaction_id"] = current_interaction_id
+    st.session_state.last_interaction_id = current_interaction_id # Garde l'ID pour le feedback
+
+if current_interaction_id and st.session_state.get(f"fb_done_{current_interaction_id}"):
+    # Retour déjà enregistré pour cette réponse: inutile de reconstruire le widget
+    st.caption("Merci pour votre retour ✅")
+elif current_interaction_id:
     # Utilisation de streamlit-feedback
     feedback = streamlit_feedback(
         feedback_type="thumbs", # "thumbs" ou "faces"
@@ -363,16 +506,17 @@ if current_interaction_id:
 
         # Mettre à jour l'interaction dans la base de données
         success = update_feedback(current_interaction_id, feedback_text, comment, feedback_value)
+
+        # Une réponse jugée mauvaise ne doit plus être resservie depuis le cache
+        if feedback_value == 0 and last_assistant_message.get("_cache_entry"):
+            cached_prompt, cached_embedding, cached_settings = last_assistant_message["_cache_entry"]
+            semantic_cache.evict(cached_prompt, cached_embedding, settings=cached_settings)
         if success:
             st.toast(f"Merci pour votre retour ({feedback_emoji}) !", icon="✅")
-            # Optionnel: Désactiver les boutons après le premier clic pour éviter les soumissions multiples
-            # Ceci est plus complexe à gérer avec la nature stateless de Streamlit sans callbacks avancés.
-            # Pour la simplicité, on se contente de l'enregistrer. L'utilisateur peut re-cliquer mais seule la dernière valeur compte.
+            # Le widget n'est plus affiché aux re-exécutions suivantes (évite les écritures en double)
+            st.session_state[f"fb_done_{current_interaction_id}"] = True
         else:
             st.toast("Erreur lors de l'enregistrement de votre retour.", icon="❌")
 
-        # Optionnel : Effacer le feedback de l'état pour éviter re-soumission au re-run
-        # st.session_state[f"feedback_{current_interaction_id}"] = None # Peut causer des pbs si mal géré
-
 else:
     st.write("Posez une question pour pouvoir donner votre avis sur la réponse.")
\ No newline at end of file
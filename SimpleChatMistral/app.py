@@ -43,19 +43,35 @@ if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Bonjour, je suis l'assistant virtuel de la mairie. Comment puis-je vous aider aujourd'hui?"}]
 
 # --- 3. Construction du prompt avec l'historique ---
-def construire_prompt_session(messages, max_messages=10):
+def estimer_tokens(texte):
+    """Estimation rapide du nombre de tokens d'un texte (~4 caractères par token)."""
+    return len(texte) // 4 + 1
+
+def construire_prompt_session(messages, max_tokens=3000):
     """
     Construit le prompt pour l'API Mistral en utilisant les messages récents.
 
     Args:
         messages (list): Liste complète des messages de la session.
-        max_messages (int): Nombre maximum de messages récents à inclure.
+        max_tokens (int): Budget approximatif de tokens pour l'historique envoyé.
 
     Returns:
         list[ChatMessage]: Liste de messages formatés pour l'API.
     """
-    # Garde seulement les N derniers messages pour limiter la taille du prompt
-    recent_messages = messages[-max_messages:] if len(messages) > max_messages else messages
+    # Un éventuel message système en tête est toujours conservé
+    system_messages = messages[:1] if messages and messages[0]["role"] == "system" else []
+    budget = max_tokens - sum(estimer_tokens(msg["content"]) for msg in system_messages)
+
+    # Garde autant de messages récents que le budget le permet (au moins le dernier),
+    # pour limiter la taille du prompt sans gaspiller de contexte sur les échanges courts
+    recent_messages = []
+    for msg in reversed(messages[len(system_messages):]):
+        cout = estimer_tokens(msg["content"])
+        if recent_messages and cout > budget:
+            break
+        recent_messages.append(msg)
+        budget -= cout
+    recent_messages = system_messages + recent_messages[::-1]
 
     # Convertit les dictionnaires en objets ChatMessage
     formatted_messages = [
@@ -73,31 +89,38 @@ def construire_prompt_session(messages, max_messages=10):
 # --- 4. Génération de réponses via l'API Mistral ---
 def generer_reponse(prompt_messages):
     """
-    Appelle l'API Mistral pour générer une réponse.
+    Appelle l'API Mistral en streaming pour générer une réponse.
 
     Args:
         prompt_messages (list[ChatMessage]): Messages formatés à envoyer à l'API.
 
-    Returns:
-        str: Le contenu de la réponse générée ou un message d'erreur.
+    Yields:
+        str: Les fragments de la réponse au fur et à mesure de leur génération,
+             ou un message d'erreur.
     """
     try:
-        response = client.chat(
+        stream = client.chat_stream(
             model=model,
             messages=prompt_messages,
             # safe_prompt=True # Décommentez si vous voulez activer le mode sécurisé
         )
-        # Vérification si la réponse contient des choix
-        if response.choices:
-            return response.choices[0].message.content
-        else:
+        recu = False
+        for chunk in stream:
+            # Vérification si le fragment contient des choix
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                recu = True
+                yield delta
+        if not recu:
             logging.error("L'API Mistral n'a retourné aucun choix.")
-            return "Je suis désolé, je n'ai pas pu générer de réponse. Aucune option retournée."
+            yield "Je suis désolé, je n'ai pas pu générer de réponse. Aucune option retournée."
     except Exception as e:
         logging.error(f"Erreur lors de l'appel à l'API Mistral: {e}")
         # Fournir plus de détails si possible, par exemple sur les erreurs de quota
         st.error(f"Erreur lors de la génération de la réponse: {e}")
-        return "Je suis désolé, j'ai rencontré un problème technique. Veuillez réessayer plus tard."
+        yield "Je suis désolé, j'ai rencontré un problème technique. Veuillez réessayer plus tard."
 
 # --- 5. Interface utilisateur Streamlit ---
 st.title("🏛️ Assistant Virtuel de la Mairie")
@@ -121,16 +144,10 @@ if prompt := st.chat_input("Posez votre question ici..."):
     # Préparation du prompt avec l'historique récent pour l'API
     prompt_messages_for_api = construire_prompt_session(st.session_state.messages)
 
-    # Affichage d'un indicateur de chargement pendant la génération
+    # Affichage de la réponse au fur et à mesure de sa génération
     with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        message_placeholder.text("...") # Indicateur visuel simple
-
-        # Génération de la réponse via l'API
-        response_content = generer_reponse(prompt_messages_for_api)
-
-        # Affichage de la réponse complète
-        message_placeholder.write(response_content)
+        # st.write_stream affiche les fragments reçus et retourne le texte complet
+        response_content = st.write_stream(generer_reponse(prompt_messages_for_api))
 
     # Ajout de la réponse de l'assistant à l'historique interne
     st.session_state.messages.append({"role": "assistant", "content": response_content})
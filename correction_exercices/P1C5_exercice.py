@@ -2,26 +2,45 @@ import spacy
 
 
 # Chargement du modèle de langue français
-nlp = spacy.load("fr_core_news_sm")
+# Seul le découpage en phrases est utile: on désactive les composants coûteux (analyse syntaxique,
+# entités nommées, lemmes, morphologie) et on active "senter", plus rapide que le parser
+nlp = spacy.load("fr_core_news_sm", disable=["parser", "ner", "lemmatizer", "attribute_ruler", "morphologizer"])
+nlp.enable_pipe("senter")
 
 
-def semantic_chunking(text, max_chunk_size=1500):
-    doc = nlp(text)
+def chunk_sentences(sentences, max_chunk_size=1500):
     chunks = []
     current_chunk = []
+    current_len = 0 # Longueur de " ".join(current_chunk), tenue à jour sans reconstruire la chaîne
 
 
-    for sent in doc.sents:
-        if len(" ".join(current_chunk + [sent.text])) <= max_chunk_size:
-            current_chunk.append(sent.text)
+    for sentence in sentences:
+        added_len = len(sentence) + (1 if current_chunk else 0) # +1 pour l'espace de jointure
+        if current_len + added_len <= max_chunk_size:
+            current_chunk.append(sentence)
+            current_len += added_len
         else:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [sent.text]
+            if current_chunk:
+                chunks.append(" ".join(current_chunk))
+            current_chunk = [sentence]
+            current_len = len(sentence)
     if current_chunk:
         chunks.append(" ".join(current_chunk))
     return chunks
 
 
+def semantic_chunking_batch(texts, max_chunk_size=1500, batch_size=32):
+    # nlp.pipe traite les documents par lots, bien plus vite que des appels nlp(text) successifs
+    return [
+        chunk_sentences((sent.text for sent in doc.sents), max_chunk_size)
+        for doc in nlp.pipe(texts, batch_size=batch_size)
+    ]
+
+
+def semantic_chunking(text, max_chunk_size=1500):
+    return semantic_chunking_batch([text], max_chunk_size)[0]
+
+
 # Lecture du document
 with open("reglementations_municipales.txt", "r", encoding="utf-8") as file:
     text = file.read()
@@ -1,5 +1,7 @@
 # utils/query_classifier.py
+import re
 import logging
+from functools import lru_cache
 from mistralai.client import MistralClient
 from mistralai.models.chat_completion import ChatMessage
 
@@ -10,21 +12,22 @@ INTENT_CHAT = "CHAT"
 DEFAULT_INTENT = INTENT_RAG # Choisir RAG par défaut pour privilégier la recherche
 
 
-def classify_query_intent(query: str, client: MistralClient, model: str = "mistral-large-latest") -> str:
-    """
-    Classifie l'intention de la requête utilisateur en utilisant l'API Mistral.
-
-
-    Args:
-        query: La question posée par l'utilisateur.
-        client: Le client Mistral initialisé.
-        model: Le modèle Mistral à utiliser pour la classification.
-
-
-    Returns:
-        L'intention détectée ("RAG" ou "CHAT").
-    """
-    classification_system_prompt = f"""
+# Heuristiques locales: évitent l'appel au LLM pour les cas évidents
+# Message composé uniquement d'une formule de politesse -> CHAT
+_HEURISTIC_CHAT = re.compile(
+    r"^\s*(bonjour|salut|bonsoir|coucou|merci( beaucoup)?|au revoir|à bientôt|(comment )?ça va|comment allez-vous)[\s!.,?]*$",
+    re.IGNORECASE
+)
+# Mots-clés de démarches et services municipaux -> RAG
+_RAG_KEYWORDS = re.compile(
+    r"\b(horaires?|papiers?|mairie|passeports?|carte d'identité|carte grise|état civil|acte de naissance|"
+    r"inscri\w*|école|cantine|crèche|permis|urbanisme|déchets?|poubelles?|stationnement|piscine|"
+    r"bibliothèque|médiathèque|conseil municipal|maire|taxe|démarches?|formulaires?|services? municipa\w*)\b",
+    re.IGNORECASE
+)
+
+# Prompt et message système construits une seule fois, à l'import du module
+_CLASSIFICATION_SYSTEM_PROMPT = """
     Votre rôle est de classifier l'intention de la question de l'utilisateur pour un chatbot de mairie.
     Répondez uniquement par "RAG" ou "CHAT". Ne fournissez aucune autre explication.
 
@@ -44,34 +47,63 @@ def classify_query_intent(query: str, client: MistralClient, model: str = "mistr
 
     Question à classifier :
     """
+_SYS_MSG = ChatMessage(role="system", content=_CLASSIFICATION_SYSTEM_PROMPT)
+
+
+@lru_cache(maxsize=2048)
+def _classify_with_llm(query: str, client: MistralClient, model: str) -> str:
+    """
+    Interroge l'API Mistral pour classifier la requête (résultat mis en cache par requête et modèle).
+
+    Les erreurs de l'API sont propagées: elles ne sont donc pas mises en cache.
+    """
+    messages = [_SYS_MSG, ChatMessage(role="user", content=query)]
+    response = client.chat(
+        model=model,
+        messages=messages,
+        temperature=0.1, # Basse température pour une réponse plus déterministe
+        max_tokens=5     # Très court, on attend juste RAG ou CHAT
+    )
+    intent = response.choices[0].message.content.strip().upper()
+
+
+    if intent in (INTENT_RAG, INTENT_CHAT):
+        return intent
+    logging.warning(f"Classification non claire reçue: '{intent}'. Utilisation de l'intention par défaut: {DEFAULT_INTENT}")
+    return DEFAULT_INTENT # Retourne l'intention par défaut si la réponse n'est pas claire
 
 
-    messages = [
-        ChatMessage(role="system", content=classification_system_prompt),
-        ChatMessage(role="user", content=query)
-    ]
+def classify_query_intent(query: str, client: MistralClient, model: str = "mistral-large-latest") -> str:
+    """
+    Classifie l'intention de la requête utilisateur.
+
+    Les cas évidents (politesses, mots-clés municipaux) sont traités localement;
+    l'API Mistral n'est appelée que pour les requêtes ambiguës.
+
+
+    Args:
+        query: La question posée par l'utilisateur.
+        client: Le client Mistral initialisé.
+        model: Le modèle Mistral à utiliser pour la classification.
+
+
+    Returns:
+        L'intention détectée ("RAG" ou "CHAT").
+    """
+    # Mots-clés vérifiés en premier: "Bonjour, quels papiers pour un passeport ?" reste une requête RAG
+    if _RAG_KEYWORDS.search(query):
+        logging.info(f"Intention détectée (mots-clés): {INTENT_RAG}")
+        return INTENT_RAG
+    if _HEURISTIC_CHAT.match(query):
+        logging.info(f"Intention détectée (politesse): {INTENT_CHAT}")
+        return INTENT_CHAT
 
 
     try:
         logging.info(f"Classification de la requête: '{query[:50]}...'")
-        response = client.chat(
-            model=model,
-            messages=messages,
-            temperature=0.1, # Basse température pour une réponse plus déterministe
-            max_tokens=5     # Très court, on attend juste RAG ou CHAT
-        )
-        intent = response.choices[0].message.content.strip().upper()
-
-
-        if intent == INTENT_RAG:
-            logging.info(f"Intention détectée: {INTENT_RAG}")
-            return INTENT_RAG
-        elif intent == INTENT_CHAT:
-            logging.info(f"Intention détectée: {INTENT_CHAT}")
-            return INTENT_CHAT
-        else:
-            logging.warning(f"Classification non claire reçue: '{intent}'. Utilisation de l'intention par défaut: {DEFAULT_INTENT}")
-            return DEFAULT_INTENT # Retourne l'intention par défaut si la réponse n'est pas claire
+        intent = _classify_with_llm(query, client, model)
+        logging.info(f"Intention détectée: {intent}")
+        return intent
 
 
     except Exception as e:
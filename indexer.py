@@ -50,6 +50,16 @@ def run_indexing(input_directory: str, data_url: Optional[str] = None):
         logging.warning("L'index final n'a pas pu être créé ou est vide.")
 
 
+def run_rebuild(index_factory: Optional[str] = None):
+    """Reconstruit l'index Faiss à partir des embeddings sauvegardés (sans appel à l'API)."""
+    logging.info("--- Reconstruction de l'index Faiss depuis les embeddings sauvegardés ---")
+    vector_store = VectorStoreManager()
+    if vector_store.rebuild_index(index_factory):
+        logging.info("--- Reconstruction terminée avec succès ---")
+    else:
+        logging.error("--- Échec de la reconstruction de l'index ---")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Script d'indexation pour l'application RAG")
     parser.add_argument(
@@ -65,8 +75,20 @@ if __name__ == "__main__":
         default=None,
         help="URL optionnelle pour télécharger et extraire un fichier inputs.zip"
     )
+    parser.add_argument(
+        "--rebuild-index",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="INDEX_FACTORY",
+        help="Reconstruit uniquement l'index Faiss depuis les embeddings sauvegardés (ex: 'IVF1024,PQ64', 'HNSW32')"
+    )
     args = parser.parse_args()
 
+    if args.rebuild_index is not None:
+        run_rebuild(args.rebuild_index or None)
+        raise SystemExit(0)
+
     # Vérifier si l'URL est passée en argument, sinon prendre celle du .env (si définie)
     # final_data_url = args.data_url if args.data_url is not None else INPUT_DATA_URL
     # Simplification: on utilise seulement l'argument --data-url pour l'instant
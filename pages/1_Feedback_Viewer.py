@@ -13,7 +13,9 @@ from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Maintenant, nous pouvons importer les modules du dossier parent
-from utils.database import get_all_interactions
+from utils.config import TIMELINE_MAX_POINTS
+from utils.downsampling import lttb_indices
+from utils.database import get_feedback_summary, get_interaction_details, get_feedback_stats, get_feedback_by_date
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -28,24 +30,22 @@ st.caption("Affiche les dernières interactions enregistrées dans la base de do
 
 # Bouton pour rafraîchir les données
 if st.button("🔄 Rafraîchir les données"):
-    st.cache_data.clear() # Invalide le cache de get_all_interactions si utilisé
+    st.cache_data.clear() # Invalide le cache des fonctions de chargement ci-dessous
 
 # Récupérer les données (utilisation de st.cache_data pour la mise en cache)
 @st.cache_data(ttl=60) # Cache les données pendant 60 secondes
 def load_data():
     logging.info("Chargement des interactions depuis la base de données pour le viewer...")
-    interactions_list = get_all_interactions(limit=200) # Augmenter la limite si besoin
-    if not interactions_list:
+    # Sources et métadonnées (JSON) ne sont pas chargées ici, seulement pour l'interaction examinée
+    df = get_feedback_summary(limit=200) # Augmenter la limite si besoin
+    if df.empty:
         # Retourne deux DataFrames vides si pas de données
         empty_df = pd.DataFrame()
         return empty_df, empty_df
 
-    # Convertir la liste de dictionnaires en DataFrame Pandas pour un affichage facile
-    df = pd.DataFrame(interactions_list)
-
     # Optionnel: Améliorer la présentation du DataFrame
-    # Convertir le timestamp en type datetime si ce n'est pas déjà fait
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    # Convertir le timestamp en type datetime (à la seconde, comme l'affichage)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[s]')
     # Trier par timestamp le plus récent en premier
     df = df.sort_values(by='timestamp', ascending=False)
     # Sélectionner et renommer les colonnes pour plus de clarté
@@ -56,8 +56,7 @@ def load_data():
         'feedback',
         'feedback_comment',
         'id', # Garder l'ID pour référence
-        'sources', # Garder les sources pour inspection si nécessaire
-        'metadata' # Informations sur le mode utilisé
+        'mode' # Mode utilisé (RAG, direct, cache...)
     ]].rename(columns={
         'timestamp': 'Date & Heure (UTC)',
         'query': 'Question Utilisateur',
@@ -65,18 +64,143 @@ def load_data():
         'feedback': 'Feedback',
         'feedback_comment': 'Commentaire',
         'id': 'ID Interaction',
-        'metadata': 'Mode'
+        'mode': 'Mode'
+    })
+    return df_display, df # Retourne aussi le df original pour l'examen d'une interaction
+
+@st.cache_data(ttl=60)
+def load_details(interaction_id: int):
+    return get_interaction_details(interaction_id)
+
+# Statistiques agrégées directement par SQLite (quelques lignes, sans charger les sources JSON)
+@st.cache_data(ttl=60)
+def load_stats():
+    logging.info("Calcul des statistiques de feedback depuis la base de données...")
+    feedback_by_date = pd.DataFrame.from_records(get_feedback_by_date(), columns=['date', 'positif', 'négatif', 'total'])
+    # Dates en datetime64 (colonne numérique plutôt qu'objets Python) et compteurs en int32
+    feedback_by_date = feedback_by_date.astype(
+        {'date': 'datetime64[s]', 'positif': 'int32', 'négatif': 'int32', 'total': 'int32'}
+    )
+    # Séries de la courbe d'évolution préparées ici, une fois par rafraîchissement du cache:
+    # les ré-exécutions de la page les passent telles quelles à build_timeline_fig
+    timeline = (
+        tuple(feedback_by_date['date']),
+        tuple(feedback_by_date['positif']),
+        tuple(feedback_by_date['négatif'])
+    )
+    return get_feedback_stats(), timeline
+
+# Figures construites une seule fois pour des données identiques et réutilisées entre les exécutions
+# (arguments hashables: nombres et tuples, pas de DataFrame)
+@st.cache_resource
+def build_bar_fig(positive_count: int, negative_count: int):
+    # Créer un graphique en barres
+    feedback_data = pd.DataFrame({
+        'Type': ['Positif', 'Négatif'],
+        'Nombre': [positive_count, negative_count]
     })
-    return df_display, df # Retourne aussi le df original si besoin d'accéder aux sources
+
+    fig = px.bar(
+        feedback_data,
+        x='Type',
+        y='Nombre',
+        color='Type',
+        color_discrete_map={'Positif': '#00CC96', 'Négatif': '#EF553B'},
+        title="Répartition des feedbacks"
+    )
+
+    # Ajouter les pourcentages sur les barres
+    fig.update_traces(texttemplate='%{y} (%{y/sum:.1%})', textposition='outside')
+    return fig
+
+@st.cache_resource
+def build_timeline_fig(dates: tuple, positives: tuple, negatives: tuple):
+    # Créer un graphique d'évolution
+    fig = go.Figure()
+
+    # Au-delà de TIMELINE_MAX_POINTS jours, chaque courbe est sous-échantillonnée (LTTB) avant
+    # d'être envoyée au navigateur: les pics et creux visibles sont conservés
+    dates = np.asarray(dates, dtype='datetime64[s]')
+    positive_idx = lttb_indices(dates, positives, TIMELINE_MAX_POINTS)
+    negative_idx = lttb_indices(dates, negatives, TIMELINE_MAX_POINTS)
+    positives, negatives = np.asarray(positives), np.asarray(negatives)
+
+    # Ajouter les lignes pour les feedbacks positifs et négatifs
+    fig.add_trace(go.Scatter(
+        x=dates[positive_idx],
+        y=positives[positive_idx],
+        mode='lines+markers',
+        name='Positifs',
+        line=dict(color='#00CC96', width=2),
+        marker=dict(size=8)
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=dates[negative_idx],
+        y=negatives[negative_idx],
+        mode='lines+markers',
+        name='Négatifs',
+        line=dict(color='#EF553B', width=2),
+        marker=dict(size=8)
+    ))
+
+    # Configurer le graphique
+    fig.update_layout(
+        title="Évolution des feedbacks par jour",
+        xaxis_title="Date",
+        yaxis_title="Nombre de feedbacks",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+# Fragment: changer d'interaction dans la liste ne réexécute que ce bloc,
+# pas la page entière (requêtes, graphiques et tableau)
+@st.fragment
+def examiner_interaction(df_original):
+    st.subheader("🔍 Examiner une interaction spécifique")
+    # Les caches de load_data et load_stats expirent séparément: la liste peut être vide
+    # alors que les statistiques comptent encore des interactions
+    if df_original.empty:
+        st.info("Aucune interaction à examiner pour le moment.")
+        return
+    selected_id = st.selectbox("Sélectionnez l'ID de l'interaction:", options=df_original['id'].tolist())
+
+    if selected_id:
+        selected_interaction = df_original[df_original['id'] == selected_id].iloc[0]
+        st.write(f"**Question:** {selected_interaction['query']}")
+        st.write(f"**Réponse:** {selected_interaction['response']}")
+        st.write(f"**Feedback:** {selected_interaction['feedback']} {selected_interaction['feedback_comment'] or ''}")
+
+        # Afficher les métadonnées (mode, confiance, etc.)
+        sources, metadata = load_details(int(selected_id))
+        if metadata and isinstance(metadata, dict):
+            mode = metadata.get('mode', 'N/A')
+            confidence = metadata.get('confidence', 0.0)
+            reason = metadata.get('reason', 'N/A')
+            st.write(f"**Mode:** {mode} (confiance: {confidence:.2f})")
+            st.write(f"**Raison:** {reason}")
+        elif metadata:
+            st.write("**Métadonnées:**")
+            st.json(metadata)
+        st.write("**Sources utilisées lors de la génération:**")
+        if sources and isinstance(sources, list):
+            for i, src in enumerate(sources):
+                meta = src.get("metadata", {})
+                with st.expander(f"Source {i+1}: `{meta.get('source', 'N/A')}` (Score: {src.get('score', 0.0):.4f})"):
+                    st.text(src.get('excerpt', src.get('text', 'N/A'))) # Les nouvelles interactions ne stockent que l'extrait
+        elif sources:
+            st.json(sources) # Affiche le JSON brut si ce n'est pas une liste
+        else:
+            st.write("Aucune source enregistrée pour cette interaction.")
 
 # Charger et afficher les données
 try:
-    df_display, df_original = load_data()
+    stats, timeline = load_stats()
 
-    if df_display.empty:
+    if stats['interactions'] == 0:
         st.warning("Aucune interaction enregistrée dans la base de données pour le moment.")
     else:
-        st.info(f"{len(df_display)} interactions trouvées.")
+        st.info(f"{stats['interactions']} interactions trouvées.")
 
         # Créer un onglet pour les statistiques et un pour les données brutes
         tab1, tab2 = st.tabs(["Statistiques", "Données brutes"])
@@ -84,22 +208,11 @@ try:
         with tab1:
             st.subheader("📊 Statistiques des feedbacks")
 
-            # Utiliser les valeurs numériques de feedback si disponibles
-
-            # Ajouter une colonne pour la valeur numérique du feedback si elle existe
-            if 'feedback_value' in df_original.columns:
-                feedback_values = df_original['feedback_value'].dropna()
-            else:
-                # Convertir les textes en valeurs numériques si la colonne n'existe pas
-                feedback_values = df_original['feedback'].apply(
-                    lambda x: 1 if x == "positif" else 0 if x == "négatif" else None
-                ).dropna()
-
             # Compter les feedbacks positifs et négatifs
-            if len(feedback_values) > 0:
-                positive_count = sum(feedback_values == 1)
-                negative_count = sum(feedback_values == 0)
-                total_count = len(feedback_values)
+            positive_count = stats['positif']
+            negative_count = stats['négatif']
+            total_count = positive_count + negative_count
+            if total_count > 0:
                 positive_percent = (positive_count / total_count * 100) if total_count > 0 else 0
                 negative_percent = (negative_count / total_count * 100) if total_count > 0 else 0
 
@@ -112,94 +225,22 @@ try:
                 with col3:
                     st.metric("Feedbacks négatifs", negative_count, f"{negative_percent:.1f}%")
 
-                # Créer un graphique en barres
-                feedback_data = pd.DataFrame({
-                    'Type': ['Positif', 'Négatif'],
-                    'Nombre': [positive_count, negative_count]
-                })
-
-                fig = px.bar(
-                    feedback_data,
-                    x='Type',
-                    y='Nombre',
-                    color='Type',
-                    color_discrete_map={'Positif': '#00CC96', 'Négatif': '#EF553B'},
-                    title="Répartition des feedbacks"
-                )
-
-                # Ajouter les pourcentages sur les barres
-                fig.update_traces(texttemplate='%{y} (%{y/sum:.1%})', textposition='outside')
-
                 # Afficher le graphique
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(build_bar_fig(positive_count, negative_count), use_container_width=True)
 
                 # Ajouter un graphique d'évolution des feedbacks dans le temps si assez de données
-                if len(df_original) >= 5:
+                if stats['interactions'] >= 5:
                     st.subheader("📈 Évolution des feedbacks dans le temps")
 
-                    # Convertir le timestamp en datetime si ce n'est pas déjà fait
-                    df_original['timestamp'] = pd.to_datetime(df_original['timestamp'])
-
-                    # Créer une colonne pour la date (sans l'heure)
-                    df_original['date'] = df_original['timestamp'].dt.date
-
-                    # Grouper par date et compter les feedbacks positifs et négatifs
-                    if 'feedback_value' in df_original.columns:
-                        # Utiliser la colonne feedback_value si disponible
-                        feedback_by_date = df_original.groupby('date').apply(
-                            lambda x: pd.Series({
-                                'positif': sum(x['feedback_value'] == 1),
-                                'négatif': sum(x['feedback_value'] == 0),
-                                'total': len(x)
-                            })
-                        ).reset_index()
-                    else:
-                        # Sinon, utiliser la colonne feedback
-                        feedback_by_date = df_original.groupby('date').apply(
-                            lambda x: pd.Series({
-                                'positif': sum(x['feedback'] == "positif"),
-                                'négatif': sum(x['feedback'] == "négatif"),
-                                'total': len(x)
-                            })
-                        ).reset_index()
-
-                    # Créer un graphique d'évolution
-                    fig2 = go.Figure()
-
-                    # Ajouter les lignes pour les feedbacks positifs et négatifs
-                    fig2.add_trace(go.Scatter(
-                        x=feedback_by_date['date'],
-                        y=feedback_by_date['positif'],
-                        mode='lines+markers',
-                        name='Positifs',
-                        line=dict(color='#00CC96', width=2),
-                        marker=dict(size=8)
-                    ))
-
-                    fig2.add_trace(go.Scatter(
-                        x=feedback_by_date['date'],
-                        y=feedback_by_date['négatif'],
-                        mode='lines+markers',
-                        name='Négatifs',
-                        line=dict(color='#EF553B', width=2),
-                        marker=dict(size=8)
-                    ))
-
-                    # Configurer le graphique
-                    fig2.update_layout(
-                        title="Évolution des feedbacks par jour",
-                        xaxis_title="Date",
-                        yaxis_title="Nombre de feedbacks",
-                        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-                    )
-
                     # Afficher le graphique
-                    st.plotly_chart(fig2, use_container_width=True)
+                    st.plotly_chart(build_timeline_fig(*timeline), use_container_width=True)
             else:
                 st.info("Aucun feedback n'a encore été donné.")
 
         with tab2:
             st.subheader("📃 Données brutes")
+            # Les interactions ne servent qu'à cet onglet et à l'examen ci-dessous
+            df_display, df_original = load_data()
             st.dataframe(
             df_display,
             use_container_width=True,
@@ -214,44 +255,13 @@ try:
                 "Feedback": st.column_config.TextColumn(width="small"),
                 "Commentaire": st.column_config.TextColumn(width="medium"),
                 "ID Interaction": st.column_config.NumberColumn(width="small"),
-                "sources": st.column_config.ListColumn(width="medium"), # Affiche comme une liste
-                "Mode": st.column_config.JsonColumn(width="medium") # Affiche les métadonnées comme JSON
+                "Mode": st.column_config.TextColumn(width="small")
             },
             hide_index=True # Cache l'index du DataFrame
         )
 
         # Optionnel: Permettre de voir les détails d'une interaction (y compris les sources)
-        st.subheader("🔍 Examiner une interaction spécifique")
-        selected_id = st.selectbox("Sélectionnez l'ID de l'interaction:", options=df_original['id'].tolist())
-
-        if selected_id:
-            selected_interaction = df_original[df_original['id'] == selected_id].iloc[0]
-            st.write(f"**Question:** {selected_interaction['query']}")
-            st.write(f"**Réponse:** {selected_interaction['response']}")
-            st.write(f"**Feedback:** {selected_interaction['feedback']} {selected_interaction['feedback_comment'] or ''}")
-
-            # Afficher les métadonnées (mode, confiance, etc.)
-            metadata = selected_interaction['metadata']
-            if metadata and isinstance(metadata, dict):
-                mode = metadata.get('mode', 'N/A')
-                confidence = metadata.get('confidence', 0.0)
-                reason = metadata.get('reason', 'N/A')
-                st.write(f"**Mode:** {mode} (confiance: {confidence:.2f})")
-                st.write(f"**Raison:** {reason}")
-            elif metadata:
-                st.write("**Métadonnées:**")
-                st.json(metadata)
-            st.write("**Sources utilisées lors de la génération:**")
-            sources = selected_interaction['sources']
-            if sources and isinstance(sources, list):
-                 for i, src in enumerate(sources):
-                     meta = src.get("metadata", {})
-                     with st.expander(f"Source {i+1}: `{meta.get('source', 'N/A')}` (Score: {src.get('score', 0.0):.4f})"):
-                         st.text(src.get('text', 'N/A'))
-            elif sources:
-                 st.json(sources) # Affiche le JSON brut si ce n'est pas une liste
-            else:
-                 st.write("Aucune source enregistrée pour cette interaction.")
+        examiner_interaction(df_original)
 
 
 except Exception as e:
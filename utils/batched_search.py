@@ -0,0 +1,109 @@
+"""
+Module de regroupement (micro-batching) des recherches Faiss
+
+Les recherches soumises en parallèle par plusieurs sessions Streamlit sont regroupées
+dans une fenêtre de temps courte et exécutées en un seul appel `index.search` sur une
+matrice (nq, d), bien plus efficace que nq appels séparés.
+"""
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils.config import BATCH_SEARCH_MAX_SIZE, BATCH_SEARCH_MAX_WAIT_MS
+from utils.vector_store import VectorStoreManager, as_faiss_queries
+
+
+class BatchedSearcher:
+    """
+    Regroupe les recherches concurrentes dans un même appel à l'index Faiss
+    """
+
+    def __init__(self, vector_store: VectorStoreManager, max_batch_size: int = BATCH_SEARCH_MAX_SIZE, max_wait_ms: float = BATCH_SEARCH_MAX_WAIT_MS):
+        """
+        Initialise le regroupeur et démarre le thread de traitement
+
+        Args:
+            vector_store: Gestionnaire de l'index Faiss et des chunks
+            max_batch_size: Nombre maximum de requêtes par lot
+            max_wait_ms: Durée maximale d'attente (en millisecondes) pour compléter un lot
+        """
+        self.vector_store = vector_store
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="faiss-batched-search", daemon=True)
+        self._worker.start()
+
+    def submit(self, query_text: str, k: int = 5, min_score: float = None, query_embedding: Optional[np.ndarray] = None) -> "Future[List[Dict[str, any]]]":
+        """
+        Soumet une recherche qui sera exécutée avec le prochain lot
+
+        Args:
+            query_text: Texte de la requête
+            k: Nombre de résultats à retourner
+            min_score: Score minimum (entre 0 et 1) pour inclure un résultat
+            query_embedding: Embedding normalisé de la requête déjà calculé, optionnel
+
+        Returns:
+            Future résolu avec la liste des chunks pertinents (même format que VectorStoreManager.search)
+        """
+        future: "Future[List[Dict[str, any]]]" = Future()
+        if self.vector_store.index is None or not self.vector_store.document_chunks:
+            logging.warning("Recherche impossible: l'index Faiss n'est pas chargé ou est vide.")
+            future.set_result([])
+            return future
+
+        # L'embedding est calculé dans le thread appelant: seul l'appel Faiss est regroupé
+        if query_embedding is None:
+            query_embedding = self.vector_store.embed_query(query_text)
+            if query_embedding is None:
+                future.set_result([])
+                return future
+
+        logging.info(f"Recherche des {k} chunks les plus pertinents pour: '{query_text}' (mise en file)")
+        self._queue.put((query_embedding, k, min_score, future))
+        return future
+
+    def _run(self):
+        """Boucle du thread de traitement: constitue les lots et les exécute."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: List[tuple]):
+        """Exécute un lot de recherches en un seul appel à l'index Faiss."""
+        # Les recherches annulées entre-temps (délai d'attente dépassé côté appelant) sont ignorées
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            # Demander plus de résultats si un score minimum est spécifié (comme VectorStoreManager.search)
+            search_ks = [k * 3 if min_score is not None else k for _, k, min_score, _ in batch]
+            # Une seule matrice (nq, d) pour un seul appel Faiss, sans boucle Python sur les requêtes
+            query_embeddings = as_faiss_queries(np.vstack([embedding for embedding, _, _, _ in batch]))
+            scores, indices = self.vector_store.index.search(query_embeddings, max(search_ks))
+            logging.debug(f"Lot de {len(batch)} recherche(s) Faiss exécuté.")
+
+            for row, ((_, k, min_score, future), search_k) in enumerate(zip(batch, search_ks)):
+                results = self.vector_store.format_results(scores[row][:search_k], indices[row][:search_k], k, min_score)
+                future.set_result(results)
+        except Exception as e:
+            logging.error(f"Erreur inattendue lors de la recherche groupée: {e}")
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
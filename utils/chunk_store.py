@@ -0,0 +1,85 @@
+"""
+Module de stockage des chunks en colonnes (Struct-of-Arrays)
+
+Au lieu d'une liste de dictionnaires (un dict de métadonnées par chunk), les chunks sont
+rangés en colonnes parallèles: textes, positions (tableaux NumPy int32) et un code de document.
+Les métadonnées communes à tous les chunks d'un document (source, catégorie, chemin...) ne sont
+stockées qu'une fois dans une table de documents. Les dictionnaires de résultat ne sont construits
+que pour les chunks effectivement retournés par une recherche.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Métadonnées propres à chaque chunk (les autres sont partagées par les chunks d'un même document)
+CHUNK_LEVEL_KEYS = ("start_index", "chunk_id_in_doc")
+
+
+class ChunkColumns:
+    """
+    Chunks indexés, stockés en colonnes et accessibles par leur position dans l'index Faiss
+    """
+
+    def __init__(self):
+        """
+        Initialise un stockage vide
+        """
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.doc_codes = np.empty(0, dtype=np.int32)       # Position du document dans self.documents
+        self.start_index = np.empty(0, dtype=np.int32)     # Position de début du chunk dans le document (-1 si inconnue)
+        self.chunk_id_in_doc = np.empty(0, dtype=np.int32) # Position du chunk dans son document
+        self.documents: List[Dict[str, any]] = []          # Métadonnées communes, une entrée par document
+
+    @classmethod
+    def from_dicts(cls, chunks: List[Dict[str, any]]) -> "ChunkColumns":
+        """
+        Construit le stockage à partir de la liste de chunks (format du fichier de chunks)
+
+        Args:
+            chunks: Chunks au format {"id", "text", "metadata"}
+
+        Returns:
+            Le stockage en colonnes
+        """
+        store = cls()
+        doc_table: Dict[Tuple, int] = {}
+        doc_codes, start_index, chunk_id_in_doc = [], [], []
+        for chunk in chunks:
+            metadata = chunk["metadata"]
+            doc_metadata = {key: value for key, value in metadata.items() if key not in CHUNK_LEVEL_KEYS}
+            doc_key = tuple(sorted((key, repr(value)) for key, value in doc_metadata.items()))
+            code = doc_table.get(doc_key)
+            if code is None:
+                code = doc_table[doc_key] = len(store.documents)
+                store.documents.append(doc_metadata)
+
+            store.ids.append(chunk["id"])
+            store.texts.append(chunk["text"])
+            doc_codes.append(code)
+            start_index.append(metadata.get("start_index", -1))
+            chunk_id_in_doc.append(metadata.get("chunk_id_in_doc", -1))
+
+        store.doc_codes = np.asarray(doc_codes, dtype=np.int32)
+        store.start_index = np.asarray(start_index, dtype=np.int32)
+        store.chunk_id_in_doc = np.asarray(chunk_id_in_doc, dtype=np.int32)
+        return store
+
+    def metadata(self, idx: int) -> Dict[str, any]:
+        """Reconstruit le dictionnaire de métadonnées d'un chunk."""
+        return {
+            **self.documents[self.doc_codes[idx]],
+            "start_index": int(self.start_index[idx]),
+            "chunk_id_in_doc": int(self.chunk_id_in_doc[idx]),
+        }
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, idx: int) -> Dict[str, any]:
+        """Retourne le chunk à la position `idx` au format {"id", "text", "metadata"}."""
+        return {"id": self.ids[idx], "text": self.texts[idx], "metadata": self.metadata(idx)}
+
+    def __iter__(self) -> Iterator[Dict[str, any]]:
+        return (self[idx] for idx in range(len(self)))
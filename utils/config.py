@@ -12,6 +12,13 @@ if not MISTRAL_API_KEY:
     # Vous pouvez choisir de lever une exception ici ou de continuer avec des fonctionnalités limitées
     # raise ValueError("Clé API Mistral manquante. Veuillez la définir dans le fichier .env")
 
+# --- API Mistral ---
+MISTRAL_ENDPOINT = "https://api.mistral.ai"
+MISTRAL_MAX_RETRIES = 4             # Nouvelles tentatives sur 429/5xx (attente exponentielle ou Retry-After)
+MISTRAL_RETRY_BACKOFF = 1.0         # Attente initiale en secondes avant une nouvelle tentative (doublée à chaque essai)
+MISTRAL_RETRY_MAX_WAIT = 30.0       # Attente maximale en secondes entre deux tentatives
+MISTRAL_STREAM_IDLE_TIMEOUT = 120.0 # Délai maximum en secondes sans fragment reçu pendant le streaming
+
 # --- Modèles Mistral ---
 EMBEDDING_MODEL = "mistral-embed"
 CHAT_MODEL = "mistral-small-latest" # Ou un autre modèle comme mistral-large-latest
@@ -21,20 +28,56 @@ CHAT_MODEL = "mistral-small-latest" # Ou un autre modèle comme mistral-large-la
 INPUT_DIR = "inputs"                # Dossier pour les données sources après extraction
 VECTOR_DB_DIR = "vector_db"         # Dossier pour stocker l'index Faiss et les chunks
 FAISS_INDEX_FILE = os.path.join(VECTOR_DB_DIR, "faiss_index.idx")
-DOCUMENT_CHUNKS_FILE = os.path.join(VECTOR_DB_DIR, "document_chunks.pkl")
+DOCUMENT_CHUNKS_FILE = os.path.join(VECTOR_DB_DIR, "document_chunks.jsonl") # Un chunk JSON par ligne
+LEGACY_DOCUMENT_CHUNKS_FILE = os.path.join(VECTOR_DB_DIR, "document_chunks.pkl") # Ancien format (pickle), lu à défaut
+EMBEDDINGS_FILE = os.path.join(VECTOR_DB_DIR, "embeddings.npy") # Embeddings normalisés (reconstruction de l'index sans API)
 
 CHUNK_SIZE = 1500                   # Taille des chunks en *caractères* (vise ~512 tokens)
 CHUNK_OVERLAP = 150                 # Chevauchement en *caractères*
 EMBEDDING_BATCH_SIZE = 32           # Taille des lots pour l'API d'embedding
+EMBEDDING_MAX_CONCURRENT = 8        # Nombre maximum de lots d'embedding envoyés en parallèle à l'API
+FAISS_ANN_MIN_VECTORS = 10000       # En dessous, index exhaustif (FAISS_EXACT_INDEX); au-delà, index approché (FAISS_ANN_INDEX)
+FAISS_EXACT_INDEX = "SQ8"           # Index exhaustif: "SQ8" (vecteurs quantifiés sur 8 bits, 4 fois plus compact) ou "FLAT" (float32)
+FAISS_ANN_INDEX = "IVF_SQ8"         # Index approché: "IVF_SQ8", "IVF_PQ" (plus compact, scores approximatifs) ou "HNSW"
+FAISS_IVF_NLIST_MAX = 1024          # Nombre maximum de listes IVF (4096 au-delà d'un million de vecteurs)
+FAISS_IVF_NPROBE = 16               # Nombre de listes IVF explorées par recherche
+FAISS_PQ_M = 64                     # Nombre de sous-quantificateurs PQ (doit diviser la dimension)
+FAISS_HNSW_M = 32                   # Nombre de voisins par nœud du graphe HNSW
+FAISS_HNSW_EF_CONSTRUCTION = 200    # Largeur de recherche HNSW lors de la construction
+FAISS_HNSW_EF_SEARCH = 64           # Largeur de recherche HNSW lors des requêtes
+FAISS_USE_GPU = True                # Entraînement/ajout sur GPU si faiss-gpu et un GPU sont disponibles
 
 # --- Configuration de la Recherche ---
 SEARCH_K = 5                        # Nombre de documents à récupérer par défaut
+QUERY_EMBEDDING_CACHE_SIZE = 4096   # Nombre maximum d'embeddings de requêtes conservés en mémoire (LRU)
+BATCH_SEARCH_MAX_SIZE = 32          # Nombre maximum de recherches regroupées dans un appel Faiss
+BATCH_SEARCH_MAX_WAIT_MS = 10       # Fenêtre d'attente (ms) pour regrouper les recherches concurrentes
+BATCH_SEARCH_TIMEOUT = 2.0          # Délai maximum (s) d'attente du résultat d'une recherche groupée
+
+# --- Configuration du Contexte envoyé au LLM ---
+CONTEXT_MAX_CHARS_PER_DOC = 800     # Nombre maximum de caractères conservés par chunk
+CONTEXT_TOTAL_BUDGET = 4000         # Nombre maximum de caractères de texte pour l'ensemble du contexte
+CONTEXT_DEDUP_THRESHOLD = 0.92      # Similarité cosinus au-delà de laquelle un chunk est un doublon
+
+# --- Configuration de la Classification des Requêtes ---
+CLASSIFIER_PROTOTYPE_THRESHOLD = None # Similarité cosinus minimale avec un exemple pour éviter l'appel au LLM
+                                     # (None: étape désactivée tant que le seuil n'est pas calibré sur des requêtes réelles annotées)
+CLASSIFIER_PROTOTYPE_MARGIN = 0.05  # Écart minimal entre le meilleur exemple RAG et le meilleur exemple DIRECT
+CLASSIFIER_LLM_CACHE_SIZE = 1024    # Nombre maximum de classifications LLM conservées en mémoire (LRU)
+
+# --- Configuration du Cache Sémantique ---
+SEMANTIC_CACHE_SIZE = 1024          # Nombre maximum de réponses conservées en cache
+SEMANTIC_CACHE_THRESHOLD = 0.95     # Similarité cosinus minimale pour réutiliser une réponse
 
 # --- Configuration de la Base de Données ---
 DATABASE_DIR = "database"
 DATABASE_FILE = os.path.join(DATABASE_DIR, "interactions.db")
 DATABASE_URL = f"sqlite:///{DATABASE_FILE}" # URL pour SQLAlchemy
 
+# --- Configuration du Visionneur de Feedbacks ---
+TIMELINE_MAX_POINTS = 500           # Nombre maximum de points par courbe d'évolution (sous-échantillonnage LTTB)
+
 # --- Configuration de l'Application ---
 APP_TITLE = "Assistant RAG"
-COMMUNE_NAME = "Triffouillis-sur-Loire" # Nom à personnaliser dans l'interface
\ No newline at end of file
+COMMUNE_NAME = "Triffouillis-sur-Loire" # Nom à personnaliser dans l'interface
+HISTORY_RECENT_MESSAGES = 10        # Nombre de messages récents affichés en détail dans le chat
\ No newline at end of file
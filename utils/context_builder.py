@@ -0,0 +1,69 @@
+"""
+Module de construction du contexte envoyé au LLM à partir des chunks récupérés
+
+Les chunks quasi identiques sont écartés et le texte est tronqué selon un budget
+en caractères, afin de limiter le nombre de tokens envoyés à l'API Mistral.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.config import CONTEXT_MAX_CHARS_PER_DOC, CONTEXT_TOTAL_BUDGET, CONTEXT_DEDUP_THRESHOLD
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+def format_doc(doc: Dict[str, any], text: str) -> str:
+    """Formate un chunk récupéré pour l'inclure dans le contexte."""
+    return f"Source: {doc['metadata'].get('source', 'Inconnue')} (Score: {doc['score']:.4f})\nContenu: {text}"
+
+
+def build_context(
+    docs: List[Dict[str, any]],
+    embeddings: Optional[np.ndarray] = None,
+    max_chars_per_doc: int = CONTEXT_MAX_CHARS_PER_DOC,
+    total_budget: int = CONTEXT_TOTAL_BUDGET,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+) -> Tuple[str, List[Dict[str, any]]]:
+    """
+    Construit le contexte à partir des chunks récupérés
+
+    Args:
+        docs: Chunks retournés par la recherche (avec text, metadata, score)
+        embeddings: Embeddings normalisés des chunks, alignés sur `docs` (optionnel).
+                    Sans embeddings, aucune déduplication n'est effectuée.
+        max_chars_per_doc: Nombre maximum de caractères conservés par chunk
+        total_budget: Nombre maximum de caractères de texte pour l'ensemble du contexte
+        dedup_threshold: Similarité cosinus au-delà de laquelle un chunk est considéré comme doublon
+
+    Returns:
+        Tuple (contexte, chunks conservés)
+    """
+    order = sorted(range(len(docs)), key=lambda i: docs[i]["score"], reverse=True)
+
+    parts = []
+    kept_docs = []
+    kept_embeddings = []
+    used = 0
+    for i in order:
+        remaining = total_budget - used
+        if remaining <= 0:
+            break
+
+        # Écarter les chunks trop similaires à un chunk déjà retenu
+        if embeddings is not None:
+            embedding = embeddings[i]
+            if kept_embeddings and float(np.max(np.stack(kept_embeddings) @ embedding)) > dedup_threshold:
+                logging.debug(f"Chunk écarté du contexte (doublon): {docs[i]['metadata'].get('source', 'Inconnue')}")
+                continue
+            kept_embeddings.append(embedding)
+
+        text = docs[i]["text"][:min(max_chars_per_doc, remaining)]
+        used += len(text)
+        parts.append(format_doc(docs[i], text))
+        kept_docs.append(docs[i])
+
+    logging.info(f"Contexte construit avec {len(kept_docs)}/{len(docs)} chunks ({used} caractères).")
+    return CONTEXT_SEPARATOR.join(parts), kept_docs
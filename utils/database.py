@@ -2,8 +2,10 @@
 import os
 import datetime
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, JSON
+import pandas as pd
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, Text, DateTime, Float, JSON, case, func, select, update
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.exc import SQLAlchemyError
 
 from .config import DATABASE_URL, DATABASE_DIR
@@ -15,7 +17,27 @@ os.makedirs(DATABASE_DIR, exist_ok=True)
 
 # Crée l'engine SQLAlchemy pour la base de données SQLite
 # `check_same_thread=False` est nécessaire pour SQLite avec Streamlit/multithreading
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, echo=False) # echo=True pour voir les requêtes SQL
+# Pool de connexions persistantes: le fichier n'est pas rouvert à chaque session, et chaque connexion
+# conserve son cache de requêtes préparées (une connexion par session concurrente, pas de StaticPool
+# partagé qui mélangerait les transactions des différents threads Streamlit)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=5,
+    max_overflow=10,
+    echo=False # echo=True pour voir les requêtes SQL
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Active le journal WAL (les lectures ne sont plus bloquées par les écritures des autres sessions) et les lectures mmap."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL") # Suffisant en mode WAL, évite un fsync par transaction
+    cursor.execute("PRAGMA temp_store=MEMORY")  # Tables temporaires (tris, GROUP BY) en mémoire
+    cursor.execute("PRAGMA mmap_size=268435456") # Lecture du fichier par mapping mémoire (jusqu'à 256 Mo)
+    cursor.close()
 
 # Crée une base de déclaration pour les modèles ORM
 Base = declarative_base()
@@ -25,7 +47,9 @@ class Interaction(Base):
     __tablename__ = 'interactions'
 
     id = Column(Integer, primary_key=True)
-    timestamp = Column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
+    # Horodatage calculé par SQLite à chaque insertion (CURRENT_TIMESTAMP, en UTC):
+    # `default` pour les tables existantes, `server_default` pour celles créées par create_all
+    timestamp = Column(DateTime(timezone=True), default=func.now(), server_default=func.now())
     query = Column(Text, nullable=False)
     response = Column(Text)
     sources = Column(JSON) # Stocke la liste des dictionnaires de sources en JSON
@@ -34,9 +58,25 @@ class Interaction(Base):
     feedback_value = Column(Integer) # 1 pour positif, 0 pour négatif, NULL pour aucun
     feedback_comment = Column(Text) # Optionnel: commentaire de feedback
 
+    __table_args__ = (
+        # Tri par date décroissante (get_feedback_summary) sans tri complet de la table
+        Index('ix_interactions_ts_desc_feedback', timestamp.desc(), feedback_value),
+        # Comptage des feedbacks (get_feedback_stats)
+        Index('ix_interactions_feedback_value', feedback_value),
+    )
+
+# Valeur numérique du feedback: feedback_value, ou à défaut déduite du texte (anciennes interactions)
+feedback_score = func.coalesce(
+    Interaction.feedback_value,
+    case((Interaction.feedback == "positif", 1), (Interaction.feedback == "négatif", 0))
+)
+
 # Crée la table dans la base de données si elle n'existe pas déjà
 try:
     Base.metadata.create_all(engine)
+    # create_all ne crée les index qu'avec la table: les ajouter aussi à une base existante
+    for index in Interaction.__table__.indexes:
+        index.create(engine, checkfirst=True)
     logging.info("Table 'interactions' vérifiée/créée dans la base de données.")
 except SQLAlchemyError as e:
     logging.error(f"Erreur lors de la création/vérification de la table: {e}")
@@ -93,28 +133,113 @@ def log_interaction(query: str, response: str, sources: list, metadata: dict = N
     finally:
         db_session.close() # Ferme toujours la session
 
-def get_all_interactions(limit: int = 100):
-    """Récupère les dernières interactions de la base de données."""
+def get_feedback_summary(limit: int = 100) -> pd.DataFrame:
+    """Récupère les dernières interactions sous forme de DataFrame, sans leurs champs JSON.
+
+    Le résultat SQL est lu directement par pandas (pas d'objets ORM ni de dictionnaires
+    intermédiaires). Du JSON des métadonnées, seul le mode est extrait, par SQLite.
+
+    Args:
+        limit: Nombre maximum d'interactions
+
+    Returns:
+        DataFrame (id, timestamp, query, response, feedback, feedback_value, feedback_comment, mode)
+    """
+    statement = (
+        select(
+            Interaction.id,
+            Interaction.timestamp,
+            Interaction.query,
+            Interaction.response,
+            Interaction.feedback,
+            Interaction.feedback_value,
+            Interaction.feedback_comment,
+            func.json_extract(Interaction.query_metadata, "$.mode").label("mode"),
+        )
+        .order_by(Interaction.timestamp.desc())
+        .limit(limit)
+    )
+    try:
+        with engine.connect() as connection:
+            # Types déclarés dès la lecture: entiers compacts (valeur de feedback nullable) et catégorie
+            df = pd.read_sql_query(
+                statement,
+                connection,
+                dtype={"id": "int32", "feedback": "category", "feedback_value": "Int8"},
+            )
+        logging.info(f"{len(df)} interactions récupérées (sans les champs JSON).")
+        return df
+    except SQLAlchemyError as e:
+        logging.error(f"Erreur lors de la récupération des interactions: {e}")
+        return pd.DataFrame()
+
+def get_interaction_details(interaction_id: int):
+    """Récupère les sources et les métadonnées d'une interaction.
+
+    Returns:
+        Tuple (sources, métadonnées), (None, None) si l'interaction est absente ou en cas d'erreur
+    """
+    db_session = SessionLocal()
+    try:
+        row = (
+            db_session.query(Interaction.sources, Interaction.query_metadata)
+            .filter(Interaction.id == interaction_id)
+            .first()
+        )
+        return tuple(row) if row else (None, None)
+    except SQLAlchemyError as e:
+        logging.error(f"Erreur lors de la récupération des détails de l'interaction {interaction_id}: {e}")
+        return None, None
+    finally:
+        db_session.close()
+
+def get_feedback_stats():
+    """Compte les interactions et les feedbacks positifs/négatifs (agrégation faite par SQLite).
+
+    Returns:
+        Dictionnaire {"interactions": total, "positif": nombre, "négatif": nombre}
+    """
+    db_session = SessionLocal()
+    try:
+        counts = dict(db_session.query(feedback_score, func.count()).group_by(feedback_score).all())
+        return {
+            "interactions": sum(counts.values()),
+            "positif": counts.get(1, 0),
+            "négatif": counts.get(0, 0),
+        }
+    except SQLAlchemyError as e:
+        logging.error(f"Erreur lors du calcul des statistiques de feedback: {e}")
+        return {"interactions": 0, "positif": 0, "négatif": 0}
+    finally:
+        db_session.close()
+
+def get_feedback_by_date():
+    """Compte les feedbacks positifs/négatifs et les interactions par jour (agrégation faite par SQLite).
+
+    Returns:
+        Liste de dictionnaires {"date", "positif", "négatif", "total"}, triée par date
+    """
     db_session = SessionLocal()
     try:
-        interactions = db_session.query(Interaction).order_by(Interaction.timestamp.desc()).limit(limit).all()
-        logging.info(f"{len(interactions)} interactions récupérées.")
-        # Convertit les objets Interaction en dictionnaires pour une manipulation plus facile (ex: Pandas)
+        day = func.date(Interaction.timestamp)
+        rows = (
+            db_session.query(
+                day,
+                func.sum(case((feedback_score == 1, 1), else_=0)),
+                func.sum(case((feedback_score == 0, 1), else_=0)),
+                func.count(),
+            )
+            .group_by(day)
+            .order_by(day)
+            .all()
+        )
         return [
-            {
-                "id": inter.id,
-                "timestamp": inter.timestamp,
-                "query": inter.query,
-                "response": inter.response,
-                "sources": inter.sources, # Déjà une liste de dicts (ou None)
-                "metadata": inter.query_metadata, # Métadonnées (mode, confiance, etc.)
-                "feedback": inter.feedback,
-                "feedback_comment": inter.feedback_comment,
-            }
-            for inter in interactions
+            {"date": datetime.date.fromisoformat(date), "positif": positive, "négatif": negative, "total": total}
+            for date, positive, negative, total in rows
+            if date is not None
         ]
     except SQLAlchemyError as e:
-        logging.error(f"Erreur lors de la récupération des interactions: {e}")
+        logging.error(f"Erreur lors du calcul des feedbacks par date: {e}")
         return []
     finally:
         db_session.close()
@@ -133,13 +258,13 @@ def update_feedback(interaction_id: int, feedback: str, feedback_comment: str =
     """
     db_session = SessionLocal()
     try:
-        interaction = db_session.query(Interaction).filter(Interaction.id == interaction_id).first()
-        if interaction:
-            # Mise à jour des valeurs
-            interaction.feedback = feedback
-            interaction.feedback_value = feedback_value
-            interaction.feedback_comment = feedback_comment
-
+        # UPDATE direct: pas de SELECT préalable ni d'objet Interaction chargé
+        result = db_session.execute(
+            update(Interaction)
+            .where(Interaction.id == interaction_id)
+            .values(feedback=feedback, feedback_value=feedback_value, feedback_comment=feedback_comment)
+        )
+        if result.rowcount:
             # Enregistrer les modifications
             db_session.commit()
             logging.info(f"Feedback mis à jour pour l'interaction ID {interaction_id}")
@@ -152,4 +277,29 @@ def update_feedback(interaction_id: int, feedback: str, feedback_comment: str =
         db_session.rollback()
         return False
     finally:
-        db_session.close()
\ No newline at end of file
+        db_session.close()
+
+def update_feedback_bulk(rows: list):
+    """Met à jour le feedback de plusieurs interactions en une seule transaction (executemany).
+
+    Args:
+        rows: Liste de dictionnaires {"id", "feedback", "feedback_value", "feedback_comment"}
+
+    Returns:
+        True si la mise à jour a réussi, False sinon
+    """
+    if not rows:
+        return True
+    db_session = SessionLocal()
+    try:
+        # UPDATE groupé par clé primaire: une seule requête préparée, un seul commit
+        db_session.execute(update(Interaction), rows)
+        db_session.commit()
+        logging.info(f"Feedback mis à jour pour {len(rows)} interactions")
+        return True
+    except SQLAlchemyError as e:
+        logging.error(f"Erreur lors de la mise à jour groupée du feedback: {e}")
+        db_session.rollback()
+        return False
+    finally:
+        db_session.close()
@@ -0,0 +1,52 @@
+"""
+Module de sous-échantillonnage des séries temporelles pour l'affichage
+
+Implémente LTTB (Largest-Triangle-Three-Buckets): la série est découpée en paquets et,
+dans chaque paquet, on conserve le point qui forme le plus grand triangle avec le point
+retenu précédemment et la moyenne du paquet suivant. Les pics et creux visibles sont
+préservés, tout en limitant le nombre de points envoyés au navigateur par Plotly.
+"""
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Sélectionne les points à conserver selon l'algorithme LTTB
+
+    Args:
+        x: Abscisses croissantes (nombres ou datetime64), de shape (n,)
+        y: Ordonnées, de shape (n,)
+        n_out: Nombre de points à conserver (au moins 3)
+
+    Returns:
+        Indices croissants des points conservés (tous les indices si n <= n_out)
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x)
+    x = x.astype("datetime64[s]").astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Le premier et le dernier point sont toujours conservés; les autres sont répartis en n_out - 2 paquets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Moyenne du paquet suivant (ou dernier point pour le dernier paquet)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        # Aires (au facteur 1/2 près) des triangles formés avec le point précédent et la moyenne suivante
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
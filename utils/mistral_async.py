@@ -0,0 +1,243 @@
+"""
+Module d'accès asynchrone à l'API Mistral via un pool de connexions HTTP/2 partagé
+
+Un unique `httpx.AsyncClient` (HTTP/2, keep-alive) vit sur une boucle asyncio dédiée,
+exécutée dans un thread de fond. Les connexions TCP/TLS sont ainsi conservées entre
+les tours de conversation et partagées par toutes les sessions Streamlit.
+
+Pour le code synchrone qui utilise le SDK (`MistralClient`), `get_mistral_client` fournit
+une instance unique dont le client HTTP est remplacé par un pool HTTP/2 équivalent.
+
+Note: on n'utilise pas `asyncio.run` à chaque appel, car la fermeture de la boucle
+invaliderait les connexions du pool qui lui sont rattachées.
+"""
+
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, List, Optional
+
+import httpx
+from email.utils import parsedate_to_datetime
+from mistralai.client import MistralClient
+from mistralai.constants import RETRY_STATUS_CODES
+from mistralai.exceptions import MistralAPIException
+from mistralai.models.chat_completion import ChatMessage
+
+from utils.config import (
+    MISTRAL_API_KEY, MISTRAL_ENDPOINT, EMBEDDING_MODEL, MISTRAL_MAX_RETRIES, MISTRAL_RETRY_BACKOFF,
+    MISTRAL_RETRY_MAX_WAIT, MISTRAL_STREAM_IDLE_TIMEOUT
+)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_http_client: Optional[httpx.AsyncClient] = None
+_mistral_client: Optional[MistralClient] = None
+_lock = threading.Lock()
+_STREAM_END = object()
+
+# Paramètres communs aux pools synchrone et asynchrone
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Retourne la boucle asyncio partagée, en démarrant son thread au premier appel."""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="mistral-async-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Retourne le client HTTP partagé (à appeler depuis la boucle partagée uniquement)."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            base_url=MISTRAL_ENDPOINT,
+            http2=True,
+            timeout=_HTTP_TIMEOUT,
+            limits=_HTTP_LIMITS,
+            headers={
+                "Authorization": f"Bearer {MISTRAL_API_KEY}",
+                "Accept": "application/json",
+            },
+        )
+    return _http_client
+
+
+def get_mistral_client() -> MistralClient:
+    """
+    Retourne le client Mistral synchrone partagé, créé au premier appel
+
+    Le SDK ne permet pas de fournir son propre client HTTP: on remplace donc le client
+    httpx interne (HTTP/1.1, un par instance) par un client HTTP/2 à connexions persistantes.
+    """
+    global _mistral_client
+    if _mistral_client is None:
+        with _lock:
+            if _mistral_client is None:
+                client = MistralClient(api_key=MISTRAL_API_KEY, endpoint=MISTRAL_ENDPOINT)
+                client._client.close()
+                client._client = httpx.Client(
+                    follow_redirects=True,
+                    timeout=_HTTP_TIMEOUT,
+                    transport=httpx.HTTPTransport(http2=True, retries=client._max_retries, limits=_HTTP_LIMITS),
+                )
+                _mistral_client = client
+    return _mistral_client
+
+
+def run(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+    """
+    Exécute une coroutine sur la boucle partagée et attend son résultat
+
+    Args:
+        coro: Coroutine à exécuter
+        timeout: Délai maximum en secondes (None pour attendre indéfiniment)
+
+    Returns:
+        Le résultat de la coroutine
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+
+async def _raise_for_status(response: httpx.Response):
+    """Convertit une réponse HTTP en erreur MistralAPIException si nécessaire."""
+    if response.status_code >= 400:
+        await response.aread()
+        raise MistralAPIException.from_response(response, message=f"Status: {response.status_code}. Message: {response.text}")
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """
+    Durée d'attente avant une nouvelle tentative
+
+    Respecte l'en-tête Retry-After (secondes ou date HTTP) s'il est présent,
+    sinon attente exponentielle. Toujours bornée par MISTRAL_RETRY_MAX_WAIT.
+    """
+    retry_after = response.headers.get("Retry-After")
+    delay = MISTRAL_RETRY_BACKOFF * 2 ** attempt
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0.0), MISTRAL_RETRY_MAX_WAIT)
+
+
+def _should_retry(response: httpx.Response, attempt: int) -> bool:
+    """Indique si la réponse justifie une nouvelle tentative (429/5xx, dans la limite de MISTRAL_MAX_RETRIES)."""
+    return response.status_code in RETRY_STATUS_CODES and attempt < MISTRAL_MAX_RETRIES
+
+
+async def aembeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> List[List[float]]:
+    """
+    Génère les embeddings d'une liste de textes
+
+    Args:
+        texts: Textes à encoder
+        model: Modèle d'embedding Mistral
+
+    Returns:
+        Liste des embeddings, dans l'ordre des textes fournis
+    """
+    for attempt in range(MISTRAL_MAX_RETRIES + 1):
+        response = await _get_http_client().post("/v1/embeddings", json={"model": model, "input": texts})
+        if not _should_retry(response, attempt):
+            break
+        delay = _retry_delay(response, attempt)
+        logging.warning(f"API Mistral (embeddings): statut {response.status_code}, nouvelle tentative dans {delay:.1f}s.")
+        await asyncio.sleep(delay)
+    await _raise_for_status(response)
+    data = sorted(response.json()["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
+
+
+async def achat_stream(model: str, messages: List[ChatMessage]) -> AsyncIterator[str]:
+    """
+    Appelle l'API Mistral Chat en streaming (Server-Sent Events)
+
+    Args:
+        model: Modèle de chat Mistral
+        messages: Messages à envoyer à l'API
+
+    Yields:
+        Les fragments de texte de la réponse au fur et à mesure de leur génération
+    """
+    payload = {
+        "model": model,
+        "messages": [message.model_dump(exclude_none=True) for message in messages],
+        "stream": True,
+    }
+    for attempt in range(MISTRAL_MAX_RETRIES + 1):
+        async with _get_http_client().stream("POST", "/v1/chat/completions", json=payload) as response:
+            # Nouvelle tentative uniquement avant le premier fragment (le statut est connu avant le corps)
+            if _should_retry(response, attempt):
+                delay = _retry_delay(response, attempt)
+            else:
+                await _raise_for_status(response)
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("choices"):
+                        delta = chunk["choices"][0].get("delta", {}).get("content") or ""
+                        if delta:
+                            yield delta
+                return
+        logging.warning(f"API Mistral (chat): statut {response.status_code}, nouvelle tentative dans {delay:.1f}s.")
+        await asyncio.sleep(delay)
+
+
+def chat_stream(model: str, messages: List[ChatMessage]) -> Iterator[str]:
+    """
+    Version synchrone de `achat_stream`, utilisable directement depuis un script Streamlit
+
+    Args:
+        model: Modèle de chat Mistral
+        messages: Messages à envoyer à l'API
+
+    Yields:
+        Les fragments de texte de la réponse au fur et à mesure de leur génération
+    """
+    fragments: "queue.Queue[Any]" = queue.Queue()
+
+    async def pump():
+        try:
+            async for delta in achat_stream(model, messages):
+                fragments.put(delta)
+        except Exception as e:
+            logging.error(f"Erreur lors du streaming de la réponse Mistral: {e}")
+            fragments.put(e)
+        finally:
+            # Toujours signaler la fin, y compris en cas d'annulation
+            fragments.put(_STREAM_END)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _get_loop())
+    try:
+        while True:
+            try:
+                item = fragments.get(timeout=MISTRAL_STREAM_IDLE_TIMEOUT)
+            except queue.Empty:
+                raise TimeoutError(f"Aucune réponse de l'API Mistral depuis {MISTRAL_STREAM_IDLE_TIMEOUT:.0f} secondes.")
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consommateur interrompu (rerun ou arrêt Streamlit) ou erreur: arrêter la lecture de la réponse
+        future.cancel()
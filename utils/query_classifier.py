@@ -4,22 +4,80 @@ Module de classification des requêtes pour déterminer si une question nécessi
 
 import re
 import logging
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
-from mistralai.client import MistralClient
+import numpy as np
 from mistralai.models.chat_completion import ChatMessage
 
-from utils.config import MISTRAL_API_KEY, CHAT_MODEL, COMMUNE_NAME
+from utils import mistral_async
+from utils.config import (
+    MISTRAL_API_KEY, CHAT_MODEL, COMMUNE_NAME, CLASSIFIER_PROTOTYPE_THRESHOLD, CLASSIFIER_PROTOTYPE_MARGIN,
+    CLASSIFIER_LLM_CACHE_SIZE
+)
+
+# Exemples de référence (texte, besoin_rag) comparés à l'embedding de la requête
+# avant de recourir au LLM pour les cas ambigus
+PROTOTYPES = [
+    ("Bonjour, comment ça va ?", False),
+    ("Merci beaucoup pour ton aide", False),
+    ("Qu'est-ce que l'intelligence artificielle ?", False),
+    ("Peux-tu m'expliquer comment fonctionne la photosynthèse ?", False),
+    ("Écris-moi un poème sur l'automne", False),
+    ("Quels sont les horaires de la mairie ?", True),
+    ("Qui est le maire actuel ?", True),
+    ("Comment inscrire mon enfant à l'école de la commune ?", True),
+    ("Où puis-je déposer mes encombrants ?", True),
+    ("Quels événements sont prévus ce week-end dans la commune ?", True),
+]
+
+# Prompt système de la classification par LLM, construit une seule fois au chargement du module
+_SYSTEM_PROMPT = f"""Vous êtes un classificateur de requêtes pour un assistant virtuel de la commune de {COMMUNE_NAME}.
+Votre tâche est de déterminer si une question nécessite une recherche dans une base de connaissances spécifique à la commune.
+
+Répondez UNIQUEMENT par "RAG" ou "DIRECT" suivi d'une brève explication:
+- "RAG" si la question porte sur des informations spécifiques à {COMMUNE_NAME} (services municipaux, événements, adresses, horaires, etc.)
+- "DIRECT" si c'est une question générale, une salutation, ou une question qui ne nécessite pas d'informations spécifiques à la commune.
+
+Exemples:
+Question: "Bonjour, comment ça va?"
+Réponse: DIRECT - Simple salutation
+
+Question: "Quels sont les horaires de la mairie?"
+Réponse: RAG - Demande d'informations spécifiques à la commune
+
+Question: "Qui est le maire actuel?"
+Réponse: RAG - Demande d'informations spécifiques à la commune
+
+Question: "Qu'est-ce que l'intelligence artificielle?"
+Réponse: DIRECT - Question générale de connaissance
+"""
+_SYSTEM_MESSAGE = ChatMessage(role="system", content=_SYSTEM_PROMPT)
+
 
 class QueryClassifier:
     """
     Classe pour classifier les requêtes et déterminer si elles nécessitent RAG
     """
     
-    def __init__(self):
+    def __init__(self, vector_store=None):
         """
         Initialise le classificateur de requêtes
+
+        Args:
+            vector_store: VectorStoreManager utilisé pour encoder les exemples de référence (optionnel).
+                          Sans lui, ou sans CLASSIFIER_PROTOTYPE_THRESHOLD, l'étape de comparaison
+                          aux exemples est désactivée.
         """
-        self.mistral_client = MistralClient(api_key=MISTRAL_API_KEY) if MISTRAL_API_KEY else None
+        # Client partagé (pool HTTP/2 persistant) plutôt qu'une connexion par instance
+        self.mistral_client = mistral_async.get_mistral_client() if MISTRAL_API_KEY else None
+
+        # Embeddings des exemples calculés une seule fois (un seul appel à l'API), de shape (P, d)
+        self._proto_embs: Optional[np.ndarray] = None
+        self._proto_labels = np.array([needs_rag for _, needs_rag in PROTOTYPES])
+        if vector_store is not None and CLASSIFIER_PROTOTYPE_THRESHOLD is not None:
+            self._proto_embs = vector_store.embed_texts([text for text, _ in PROTOTYPES])
+            if self._proto_embs is None:
+                logging.warning("Embeddings des exemples de classification indisponibles: étape désactivée.")
         
         # Mots-clés liés à la commune qui suggèrent un besoin de RAG
         self.commune_keywords = [
@@ -46,37 +104,70 @@ class QueryClassifier:
             r"^(qui es[- ]tu|qu'es[- ]tu|que fais[- ]tu|comment fonctionnes[- ]tu|tu es quoi)[\s\?]*$",
             r"^(aide|help|sos|besoin d'aide)[\s\.,!?]*$"
         ]
+
+        # Compilés une seule fois: une seule alternative pour les patterns (un appel au lieu de six)
+        # et pour les mots-clés (un seul parcours de la requête au lieu d'un test `in` par mot-clé).
+        # Les mots-clés les plus longs sont essayés en premier ("transport" plutôt que "sport").
+        # Pas de \b: comme avec `in`, "horaire" reconnaît aussi "horaires".
+        self._general_re = re.compile("|".join(f"(?:{pattern})" for pattern in self.general_patterns))
+        self._keywords_re = re.compile(
+            "|".join(re.escape(kw) for kw in sorted(self.commune_keywords, key=len, reverse=True))
+        )
     
-    def needs_rag(self, query: str) -> Tuple[bool, float, str]:
+    def needs_rag(self, query: str, query_embedding: Optional[np.ndarray] = None) -> Tuple[bool, float, str]:
         """
         Détermine si une requête nécessite RAG
         
         Args:
             query: Requête de l'utilisateur
+            query_embedding: Embedding normalisé de la requête déjà calculé (optionnel)
             
         Returns:
             Tuple (besoin_rag, confiance, raison)
         """
+        # 0. Filtres immédiats sur la forme de la requête (avant toute regex, embedding ou appel au LLM)
+        stripped = query.strip()
+        if len(stripped) <= 3:
+            return False, 0.99, "Requête trop courte"
+        if not any(char.isalpha() for char in stripped):
+            return False, 0.95, "Requête sans texte (ponctuation, chiffres ou emojis)"
+        if len(stripped.split()) > 30:
+            return True, 0.9, "Question longue et détaillée"
+        
         # Convertir la requête en minuscules pour la comparaison
         query_lower = query.lower()
         
         # 1. Vérifier les patterns de questions générales (salutations, remerciements, etc.)
-        for pattern in self.general_patterns:
-            if re.match(pattern, query_lower):
-                return False, 0.95, "Question générale ou salutation"
+        if self._general_re.match(query_lower):
+            return False, 0.95, "Question générale ou salutation"
         
         # 2. Vérifier la présence de mots-clés liés à la commune
-        commune_keywords_found = [kw for kw in self.commune_keywords if kw in query_lower]
+        commune_keywords_found = list(dict.fromkeys(self._keywords_re.findall(query_lower)))
         if commune_keywords_found:
             keywords_str = ", ".join(commune_keywords_found)
             return True, 0.9, f"Contient des mots-clés liés à la commune: {keywords_str}"
         
-        # 3. Utiliser le LLM pour les cas ambigus
+        # 3. Comparer la requête aux exemples de référence (un seul produit matriciel)
+        if query_embedding is not None and self._proto_embs is not None:
+            scores = self._proto_embs @ query_embedding.reshape(-1)
+            best = int(np.argmax(scores))
+            # Les similarités de mistral-embed sont élevées même entre sujets voisins: l'exemple le plus
+            # proche doit aussi devancer nettement le meilleur exemple de l'autre catégorie
+            other = scores[self._proto_labels != self._proto_labels[best]]
+            margin = scores[best] - (other.max() if other.size else -1.0)
+            if scores[best] >= CLASSIFIER_PROTOTYPE_THRESHOLD and margin >= CLASSIFIER_PROTOTYPE_MARGIN:
+                return bool(self._proto_labels[best]), float(scores[best]), f"Proche de l'exemple: '{PROTOTYPES[best][0]}'"
+
+        # Requête très courte sans mot-clé ni exemple proche: réponse directe, sans appel au LLM
+        words = query.split()
+        if len(words) <= 3:
+            return False, 0.6, "Requête courte sans mot-clé lié à la commune"
+        
+        # 4. Utiliser le LLM pour les cas ambigus
         if self.mistral_client:
             return self._classify_with_llm(query)
         
         # Par défaut, utiliser RAG pour les questions longues (plus de 5 mots)
-        words = query.split()
         if len(words) > 5:
             return True, 0.6, "Question complexe (plus de 5 mots)"
         
@@ -85,7 +176,7 @@ class QueryClassifier:
     
     def _classify_with_llm(self, query: str) -> Tuple[bool, float, str]:
         """
-        Utilise le LLM pour classifier la requête
+        Utilise le LLM pour classifier la requête (résultat mis en cache pour les requêtes répétées)
         
         Args:
             query: Requête de l'utilisateur
@@ -93,57 +184,66 @@ class QueryClassifier:
         Returns:
             Tuple (besoin_rag, confiance, raison)
         """
+        # Normalisation: "Bonjour " et "bonjour" partagent la même entrée du cache
         try:
-            system_prompt = f"""Vous êtes un classificateur de requêtes pour un assistant virtuel de la commune de {COMMUNE_NAME}.
-Votre tâche est de déterminer si une question nécessite une recherche dans une base de connaissances spécifique à la commune.
+            return _classify_cached(_NormalizedQuery(query), CHAT_MODEL)
+        except Exception as e:
+            logging.error(f"Erreur lors de la classification avec LLM: {e}")
+            # En cas d'erreur, utiliser RAG par défaut
+            return True, 0.5, f"Erreur de classification: {str(e)}"
 
-Répondez UNIQUEMENT par "RAG" ou "DIRECT" suivi d'une brève explication:
-- "RAG" si la question porte sur des informations spécifiques à {COMMUNE_NAME} (services municipaux, événements, adresses, horaires, etc.)
-- "DIRECT" si c'est une question générale, une salutation, ou une question qui ne nécessite pas d'informations spécifiques à la commune.
 
-Exemples:
-Question: "Bonjour, comment ça va?"
-Réponse: DIRECT - Simple salutation
+class _NormalizedQuery(str):
+    """
+    Requête normalisée (minuscules, espaces réduits) qui conserve le texte d'origine
 
-Question: "Quels sont les horaires de la mairie?"
-Réponse: RAG - Demande d'informations spécifiques à la commune
+    Sert de clé à lru_cache (égalité et hachage portent sur la forme normalisée), tandis que
+    le LLM reçoit le texte d'origine: casse des noms de lieux et des sigles préservée.
+    """
 
-Question: "Qui est le maire actuel?"
-Réponse: RAG - Demande d'informations spécifiques à la commune
+    def __new__(cls, query: str):
+        normalized = super().__new__(cls, " ".join(query.lower().split()))
+        normalized.original = query.strip()
+        return normalized
 
-Question: "Qu'est-ce que l'intelligence artificielle?"
-Réponse: DIRECT - Question générale de connaissance
-"""
-            
-            messages = [
-                ChatMessage(role="system", content=system_prompt),
-                ChatMessage(role="user", content=query)
-            ]
-            
-            response = self.mistral_client.chat(
-                model=CHAT_MODEL,
-                messages=messages,
-                temperature=0.1,  # Température basse pour des réponses cohérentes
-                max_tokens=50  # Réponse courte suffisante
-            )
-            
-            result = response.choices[0].message.content.strip()
-            logging.info(f"Classification LLM pour '{query}': {result}")
-            
-            # Analyser la réponse
-            if result.startswith("RAG"):
-                confidence = 0.85  # Confiance élevée dans la décision du LLM
-                reason = result.replace("RAG - ", "").replace("RAG-", "").replace("RAG:", "").strip()
-                return True, confidence, reason
-            elif result.startswith("DIRECT"):
-                confidence = 0.85
-                reason = result.replace("DIRECT - ", "").replace("DIRECT-", "").replace("DIRECT:", "").strip()
-                return False, confidence, reason
-            else:
-                # Réponse ambiguë, utiliser RAG par défaut
-                return True, 0.6, "Classification ambiguë, utilisation de RAG par précaution"
-                
-        except Exception as e:
-            logging.error(f"Erreur lors de la classification avec LLM: {e}")
-            # En cas d'erreur, utiliser RAG par défaut
-            return True, 0.5, f"Erreur de classification: {str(e)}"
+
+@lru_cache(maxsize=CLASSIFIER_LLM_CACHE_SIZE)
+def _classify_cached(query_norm: _NormalizedQuery, model: str) -> Tuple[bool, float, str]:
+    """
+    Appelle le LLM pour classifier une requête normalisée
+    
+    Mise en cache au niveau du module: partagée par toutes les sessions et conservée entre les
+    exécutions du script Streamlit. Les erreurs de l'API sont propagées et ne sont pas mises en cache.
+    
+    Args:
+        query_norm: Requête normalisée (clé du cache); le texte d'origine de la première
+                    requête rencontrée est envoyé au LLM
+        model: Modèle de chat Mistral
+        
+    Returns:
+        Tuple (besoin_rag, confiance, raison)
+    """
+    messages = [_SYSTEM_MESSAGE, ChatMessage(role="user", content=query_norm.original)]
+    
+    response = mistral_async.get_mistral_client().chat(
+        model=model,
+        messages=messages,
+        temperature=0.1,  # Température basse pour des réponses cohérentes
+        max_tokens=50  # Réponse courte suffisante
+    )
+    
+    result = response.choices[0].message.content.strip()
+    logging.info(f"Classification LLM pour '{query_norm.original}': {result}")
+    
+    # Analyser la réponse
+    if result.startswith("RAG"):
+        confidence = 0.85  # Confiance élevée dans la décision du LLM
+        reason = result.replace("RAG - ", "").replace("RAG-", "").replace("RAG:", "").strip()
+        return True, confidence, reason
+    elif result.startswith("DIRECT"):
+        confidence = 0.85
+        reason = result.replace("DIRECT - ", "").replace("DIRECT-", "").replace("DIRECT:", "").strip()
+        return False, confidence, reason
+    else:
+        # Réponse ambiguë, utiliser RAG par défaut
+        return True, 0.6, "Classification ambiguë, utilisation de RAG par précaution"
@@ -0,0 +1,176 @@
+"""
+Module de cache sémantique des réponses (inspiré de GPTCache)
+
+Deux niveaux de cache :
+- un cache exact, indexé par les paramètres de génération et la requête normalisée (LRU borné)
+- un cache approximatif, basé sur la similarité cosinus entre l'embedding de la
+  requête et ceux des requêtes déjà traitées avec les mêmes paramètres (index Faiss IndexFlatIP)
+
+Les réponses ayant reçu un retour négatif sont retirées du cache (evict).
+"""
+
+import re
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from utils.config import SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD
+
+
+@lru_cache(maxsize=4096)
+def _normalize(prompt: str) -> str:
+    """Normalise une requête (minuscules, espaces superflus) pour le cache exact."""
+    return re.sub(r"\s+", " ", prompt.strip().lower())
+
+
+class SemanticCache:
+    """
+    Cache des réponses générées, interrogeable par texte exact ou par similarité
+    """
+
+    def __init__(self, max_size: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        """
+        Initialise le cache
+
+        Args:
+            max_size: Nombre maximum d'entrées conservées
+            threshold: Similarité cosinus minimale (entre 0 et 1) pour un hit approximatif
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # (paramètres, requête normalisée) -> (réponse, sources), du plus ancien au plus récent
+        self._entries: "OrderedDict[Tuple[Hashable, str], Tuple[str, List[Dict[str, any]]]]" = OrderedDict()
+        # Embeddings des requêtes en cache, alignés sur self._keys (clés indexées: self._indexed)
+        self._keys: List[Tuple[Hashable, str]] = []
+        self._indexed: set = set()
+        self._embeddings: Optional[np.ndarray] = None
+        self._index: Optional[faiss.Index] = None
+
+    def _neighbors(self, settings: Hashable, embedding: np.ndarray) -> List[Tuple[float, Tuple[Hashable, str]]]:
+        """Clés en cache de mêmes paramètres dont la similarité atteint le seuil, de la plus proche à la plus lointaine."""
+        if self._index is None or self._index.ntotal == 0:
+            return []
+        vector = np.asarray(embedding, dtype='float32').reshape(1, -1)
+        # Recherche par rayon: toutes les entrées au-dessus du seuil, quels que soient leurs paramètres
+        _, scores, indices = self._index.range_search(vector, self.threshold)
+        hits = sorted(zip(scores.tolist(), indices.tolist()), reverse=True)
+        return [(score, self._keys[idx]) for score, idx in hits if self._keys[idx][0] == settings]
+
+    def lookup(self, prompt: str, embedding: Optional[np.ndarray] = None, settings: Hashable = ()) -> Optional[Tuple[str, List[Dict[str, any]]]]:
+        """
+        Recherche une réponse en cache pour une requête
+
+        Args:
+            prompt: Requête de l'utilisateur
+            embedding: Embedding normalisé de la requête (shape (1, d)), optionnel.
+                       S'il est fourni, une recherche approximative est effectuée
+                       en cas d'échec du cache exact.
+            settings: Paramètres de génération (modèle, nombre de documents, score minimum...):
+                      seules les réponses générées avec les mêmes paramètres sont réutilisées
+
+        Returns:
+            Tuple (réponse, sources) ou None si aucune entrée ne correspond
+        """
+        key = (settings, _normalize(prompt))
+        with self._lock:
+            # 1. Cache exact
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                logging.info(f"Cache sémantique: hit exact pour '{prompt[:50]}'")
+                return self._entries[key]
+
+            # 2. Cache approximatif par similarité d'embedding
+            if embedding is None:
+                return None
+            neighbors = self._neighbors(settings, embedding)
+            if not neighbors:
+                return None
+            score, cached_key = neighbors[0]
+            self._entries.move_to_end(cached_key)
+            logging.info(f"Cache sémantique: hit approximatif pour '{prompt[:50]}' (similarité: {score:.4f})")
+            return self._entries[cached_key]
+
+    def store(self, prompt: str, embedding: Optional[np.ndarray], response: str, sources: List[Dict[str, any]], settings: Hashable = ()):
+        """
+        Enregistre une réponse dans le cache
+
+        Args:
+            prompt: Requête de l'utilisateur
+            embedding: Embedding normalisé de la requête (shape (1, d)), ou None
+                       pour n'alimenter que le cache exact
+            response: Réponse générée
+            sources: Sources utilisées pour la réponse
+            settings: Paramètres de génération utilisés pour la réponse (voir lookup)
+        """
+        key = (settings, _normalize(prompt))
+        with self._lock:
+            self._entries[key] = (response, sources)
+            self._entries.move_to_end(key)
+
+            # Une entrée déjà présente mais stockée sans embedding est ajoutée à l'index
+            if embedding is not None and key not in self._indexed:
+                vector = np.asarray(embedding, dtype='float32').reshape(1, -1)
+                if self._embeddings is None:
+                    self._embeddings = vector
+                    self._index = faiss.IndexFlatIP(vector.shape[1])
+                else:
+                    self._embeddings = np.vstack([self._embeddings, vector])
+                self._keys.append(key)
+                self._indexed.add(key)
+                self._index.add(vector)
+
+            # Éviction des entrées les plus anciennes si le cache est plein
+            if len(self._entries) > self.max_size:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                self._rebuild_index()
+
+    def evict(self, prompt: str, embedding: Optional[np.ndarray] = None, settings: Hashable = ()):
+        """
+        Retire du cache les réponses qui seraient servies pour une requête (ex: après un retour négatif)
+
+        Args:
+            prompt: Requête de l'utilisateur
+            embedding: Embedding normalisé de la requête: s'il est fourni, les entrées
+                       similaires (hits approximatifs possibles) sont aussi retirées
+            settings: Paramètres de génération de la réponse (voir lookup)
+        """
+        key = (settings, _normalize(prompt))
+        with self._lock:
+            evicted = {key} if key in self._entries else set()
+            if embedding is not None:
+                evicted.update(cached_key for _, cached_key in self._neighbors(settings, embedding))
+            if not evicted:
+                return
+            for cached_key in evicted:
+                del self._entries[cached_key]
+            self._rebuild_index()
+            logging.info(f"Cache sémantique: {len(evicted)} entrée(s) retirée(s) pour '{prompt[:50]}'")
+
+    def _rebuild_index(self):
+        """Reconstruit l'index Faiss à partir des entrées encore présentes dans le cache."""
+        kept = [i for i, key in enumerate(self._keys) if key in self._entries]
+        self._keys = [self._keys[i] for i in kept]
+        self._indexed = set(self._keys)
+        if not kept:
+            self._embeddings = None
+            self._index = None
+            return
+        self._embeddings = np.ascontiguousarray(self._embeddings[kept])
+        self._index = faiss.IndexFlatIP(self._embeddings.shape[1])
+        self._index.add(self._embeddings)
+
+    def clear(self):
+        """Vide entièrement le cache."""
+        with self._lock:
+            self._entries.clear()
+            self._keys = []
+            self._indexed = set()
+            self._embeddings = None
+            self._index = None
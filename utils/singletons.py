@@ -0,0 +1,32 @@
+# utils/singletons.py
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+# Les objets coûteux (index Faiss, clients API, classificateur...) sont stockés au niveau du module:
+# contrairement aux variables du script Streamlit, ils survivent aux re-exécutions et sont
+# partagés par toutes les sessions du processus.
+_SINGLETONS: Dict[str, Any] = {}
+_LOCK = threading.Lock()
+
+def get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    """Retourne l'objet partagé `name`, en le créant avec `factory` au premier appel.
+
+    Args:
+        name: Nom unique de l'objet partagé
+        factory: Fonction sans argument qui construit l'objet
+
+    Returns:
+        L'instance partagée
+    """
+    instance = _SINGLETONS.get(name)
+    if instance is not None:
+        return instance
+    with _LOCK:
+        # Double vérification: un autre thread a pu créer l'objet entre-temps
+        instance = _SINGLETONS.get(name)
+        if instance is None:
+            logging.info(f"Création de l'objet partagé '{name}'...")
+            instance = factory()
+            _SINGLETONS[name] = instance
+        return instance
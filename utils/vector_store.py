@@ -1,75 +1,259 @@
 # utils/vector_store.py
 import os
 import pickle
+import orjson
+import asyncio
+import threading
 import faiss
 import numpy as np
 import logging
-from typing import List, Dict, Tuple, Optional
-from mistralai.client import MistralClient
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
 from mistralai.exceptions import MistralAPIException
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document # Utilisé pour le format attendu par le splitter
 
+from . import mistral_async
+from .chunk_store import ChunkColumns
 from .config import (
-    MISTRAL_API_KEY, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE,
-    FAISS_INDEX_FILE, DOCUMENT_CHUNKS_FILE, CHUNK_SIZE, CHUNK_OVERLAP
+    MISTRAL_API_KEY, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENT,
+    FAISS_INDEX_FILE, DOCUMENT_CHUNKS_FILE, LEGACY_DOCUMENT_CHUNKS_FILE, EMBEDDINGS_FILE, CHUNK_SIZE, CHUNK_OVERLAP,
+    FAISS_ANN_MIN_VECTORS, FAISS_EXACT_INDEX, FAISS_ANN_INDEX, FAISS_IVF_NLIST_MAX, FAISS_IVF_NPROBE, FAISS_PQ_M,
+    FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH, FAISS_USE_GPU, QUERY_EMBEDDING_CACHE_SIZE
 )
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def _available_cpus() -> int:
+    """Nombre de cœurs utilisables par le processus (respecte l'affinité CPU / les limites du conteneur)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError: # sched_getaffinity n'existe pas sous macOS / Windows
+        return os.cpu_count() or 1
+
+# Séparateurs de découpage, du plus naturel au moins naturel (paragraphe, ligne, mot)
+CHUNK_SEPARATORS = ("\n\n", "\n", " ")
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, str]]:
+    """
+    Découpe un texte en chunks d'au plus `chunk_size` caractères, avec chevauchement.
+
+    Chaque coupure est placée sur le dernier séparateur disponible de la fenêtre (paragraphe,
+    sinon ligne, sinon espace). Les recherches de séparateurs se font avec str.rfind / str.find
+    (implémentés en C): le texte est parcouru une seule fois, sans découpages intermédiaires.
+
+    Args:
+        text: Texte à découper
+        chunk_size: Taille maximale d'un chunk (en caractères)
+        chunk_overlap: Chevauchement approximatif entre deux chunks consécutifs (en caractères)
+
+    Returns:
+        Liste de tuples (position de début dans le texte, texte du chunk)
+    """
+    chunks = []
+    length = len(text)
+    start = 0
+    while start < length:
+        # Ignorer les blancs en début de chunk
+        while start < length and text[start].isspace():
+            start += 1
+        if start >= length:
+            break
+
+        end = min(start + chunk_size, length)
+        if end < length:
+            # Couper sur le meilleur séparateur de la seconde moitié de la fenêtre
+            for separator in CHUNK_SEPARATORS:
+                cut = text.rfind(separator, start + chunk_size // 2, end)
+                if cut != -1:
+                    end = cut
+                    break
+
+        chunk = text[start:end].rstrip()
+        if chunk:
+            chunks.append((start, chunk))
+        if end >= length:
+            break
+
+        # Le chunk suivant reprend `chunk_overlap` caractères plus tôt, au début d'un mot
+        next_start = max(end - chunk_overlap, start + 1)
+        if next_start < end:
+            space = text.find(" ", next_start, end)
+            next_start = space + 1 if space != -1 else end
+        start = next_start
+    return chunks
+
+def mmap_read_flags(index_file: str) -> int:
+    """
+    Retourne les options de faiss.read_index permettant de projeter l'index en mémoire.
+
+    IO_FLAG_MMAP ne s'applique qu'aux listes inversées des index IVF (OnDiskInvertedLists):
+    pour les index à codes plats (Flat, SQ, HNSW), seul IO_FLAG_MMAP_IFC évite de copier
+    les vecteurs en RAM. Le type d'index est lu dans les 4 premiers octets du fichier.
+    """
+    with open(index_file, 'rb') as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(b"Iw"): # Index IVF ("IwFl", "IwSq", "IwPQ"...)
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # IO_FLAG_MMAP_IFC n'existe pas dans les versions anciennes de Faiss
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+def train_and_add(index: faiss.Index, embeddings: np.ndarray, training: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    Entraîne l'index si nécessaire puis y ajoute les embeddings, sur GPU lorsque c'est possible.
+
+    Avec faiss-gpu et au moins un GPU (et FAISS_USE_GPU), l'index est copié sur le GPU 0,
+    entraîné et rempli, puis recopié sur CPU: la recherche reste sur CPU. Les types d'index
+    non supportés par le GPU (HNSW, SQ8 exhaustif...) sont construits sur CPU (multi-thread OpenMP).
+
+    Args:
+        index: Index Faiss vide
+        embeddings: Embeddings normalisés à ajouter, de shape (n, d)
+        training: Vecteurs d'entraînement (par défaut: les embeddings)
+
+    Returns:
+        L'index rempli (nouvel objet si construit sur GPU)
+    """
+    training = embeddings if training is None else training
+    if FAISS_USE_GPU and hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0:
+        try:
+            gpu_index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+            if not gpu_index.is_trained:
+                gpu_index.train(training)
+            gpu_index.add(embeddings)
+            logging.info(f"Index {type(index).__name__} construit sur GPU.")
+            return faiss.index_gpu_to_cpu(gpu_index)
+        except Exception as e: # Type d'index non supporté sur GPU: construction sur CPU
+            logging.warning(f"Construction sur GPU impossible ({e}), utilisation du CPU.")
+    if not index.is_trained:
+        index.train(training)
+    index.add(embeddings)
+    return index
+
+def _read_chunks_jsonl(path: str) -> Iterator[Dict[str, any]]:
+    """Lit un fichier de chunks JSON Lines, un chunk à la fois (pic mémoire limité à une ligne)."""
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+def as_faiss_queries(query_embeddings: np.ndarray) -> np.ndarray:
+    """
+    Prépare une matrice de requêtes pour index.search: shape (nq, d), float32, C-contiguë.
+
+    Faiss copie silencieusement les tableaux qui ne respectent pas ce format.
+    """
+    if query_embeddings.ndim == 1:
+        query_embeddings = query_embeddings.reshape(1, -1)
+    if query_embeddings.dtype != np.float32 or not query_embeddings.flags["C_CONTIGUOUS"]:
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+    return query_embeddings
+
 class VectorStoreManager:
     """Gère la création, le chargement et la recherche dans un index Faiss."""
 
     def __init__(self):
+        # Utilise tous les cœurs disponibles pour les recherches Faiss (une recherche = un appel OpenMP)
+        faiss.omp_set_num_threads(_available_cpus())
         self.index: Optional[faiss.Index] = None
-        self.document_chunks: List[Dict[str, any]] = []
-        self.mistral_client = MistralClient(api_key=MISTRAL_API_KEY)
+        self.document_chunks = ChunkColumns()
+        # Cache LRU des embeddings de requêtes (texte -> vecteur normalisé), partagé entre sessions
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
         self._load_index_and_chunks()
 
     def _load_index_and_chunks(self):
         """Charge l'index Faiss et les chunks si les fichiers existent."""
-        if os.path.exists(FAISS_INDEX_FILE) and os.path.exists(DOCUMENT_CHUNKS_FILE):
+        chunks_file = DOCUMENT_CHUNKS_FILE if os.path.exists(DOCUMENT_CHUNKS_FILE) else LEGACY_DOCUMENT_CHUNKS_FILE
+        if os.path.exists(FAISS_INDEX_FILE) and os.path.exists(chunks_file):
             try:
                 logging.info(f"Chargement de l'index Faiss depuis {FAISS_INDEX_FILE}...")
-                self.index = faiss.read_index(FAISS_INDEX_FILE)
-                logging.info(f"Chargement des chunks depuis {DOCUMENT_CHUNKS_FILE}...")
-                with open(DOCUMENT_CHUNKS_FILE, 'rb') as f:
-                    self.document_chunks = pickle.load(f)
+                # Mapping mémoire en lecture seule: les pages de l'index sont chargées à la demande
+                # et partagées entre processus via le cache de pages du système
+                self.index = faiss.read_index(FAISS_INDEX_FILE, mmap_read_flags(FAISS_INDEX_FILE))
+                self._configure_index()
+                logging.info(f"Chargement des chunks depuis {chunks_file}...")
+                if chunks_file == DOCUMENT_CHUNKS_FILE:
+                    self.document_chunks = ChunkColumns.from_dicts(_read_chunks_jsonl(chunks_file))
+                else:
+                    with open(chunks_file, 'rb') as f:
+                        self.document_chunks = ChunkColumns.from_dicts(pickle.load(f))
                 logging.info(f"Index ({self.index.ntotal} vecteurs) et {len(self.document_chunks)} chunks chargés.")
             except Exception as e:
                 logging.error(f"Erreur lors du chargement de l'index/chunks: {e}")
                 self.index = None
-                self.document_chunks = []
+                self.document_chunks = ChunkColumns()
         else:
             logging.warning("Fichiers d'index Faiss ou de chunks non trouvés. L'index est vide.")
 
+    def _configure_index(self):
+        """Applique les paramètres de recherche à un index IVF ou HNSW (sans effet sur un index exact)."""
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = FAISS_IVF_NPROBE
+            # Nécessaire pour reconstruire les embeddings des chunks (voir get_chunk_embeddings)
+            ivf.make_direct_map()
+        elif isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+
+    def _create_index(self, embeddings: np.ndarray) -> faiss.Index:
+        """
+        Crée l'index Faiss adapté au nombre de vecteurs et y ajoute les embeddings.
+
+        Petit corpus: index exhaustif selon FAISS_EXACT_INDEX, quantifié sur 8 bits (IndexScalarQuantizer)
+        ou en float32 (IndexFlatIP). Grand corpus: index approché selon FAISS_ANN_INDEX:
+        - IVF_SQ8: listes inversées + quantification scalaire 8 bits (4 fois plus compact)
+        - IVF_PQ: listes inversées + quantification par produit (bien plus compact, scores approximatifs)
+        - HNSW: graphe de voisinage, vecteurs non compressés (recherche la plus rapide, plus de mémoire)
+
+        Args:
+            embeddings: Embeddings normalisés, de shape (n, d)
+
+        Returns:
+            L'index Faiss rempli
+        """
+        num_vectors, dimension = embeddings.shape
+        index_type = FAISS_ANN_INDEX
+        if index_type == "IVF_PQ" and dimension % FAISS_PQ_M != 0:
+            logging.warning(f"FAISS_PQ_M={FAISS_PQ_M} ne divise pas la dimension {dimension}: utilisation de IVF_SQ8.")
+            index_type = "IVF_SQ8"
+
+        if num_vectors < FAISS_ANN_MIN_VECTORS and FAISS_EXACT_INDEX == "SQ8":
+            # Parcours exhaustif sur des vecteurs quantifiés: 4 fois moins de mémoire lue par recherche
+            index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        elif num_vectors < FAISS_ANN_MIN_VECTORS:
+            # Créer un index pour la similarité cosinus (IndexFlatIP = produit scalaire)
+            index = faiss.IndexFlatIP(dimension)
+        elif index_type == "HNSW":
+            logging.info(f"Construction d'un index HNSW{FAISS_HNSW_M} sur {num_vectors} vecteurs...")
+            index = faiss.IndexHNSWFlat(dimension, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        else:
+            # Au moins ~39 vecteurs d'entraînement par liste pour un clustering fiable
+            nlist_max = 4096 if num_vectors >= 1_000_000 else FAISS_IVF_NLIST_MAX
+            nlist = min(nlist_max, num_vectors // 39)
+            encoding = f"PQ{FAISS_PQ_M}" if index_type == "IVF_PQ" else "SQ8"
+            logging.info(f"Entraînement d'un index IVF{nlist},{encoding} sur {num_vectors} vecteurs...")
+            index = faiss.index_factory(dimension, f"IVF{nlist},{encoding}", faiss.METRIC_INNER_PRODUCT)
+        return train_and_add(index, embeddings)
+
     def _split_documents_to_chunks(self, documents: List[Dict[str, any]]) -> List[Dict[str, any]]:
         """Découpe les documents en chunks avec métadonnées."""
         logging.info(f"Découpage de {len(documents)} documents en chunks (taille={CHUNK_SIZE}, chevauchement={CHUNK_OVERLAP})...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len, # Important: mesure en caractères
-            add_start_index=True, # Ajoute la position de début du chunk dans le document original
-        )
 
         all_chunks = []
         doc_counter = 0
         for doc in documents:
-            # Convertit notre format de document en format Langchain Document pour le splitter
-            langchain_doc = Document(page_content=doc["page_content"], metadata=doc["metadata"])
-            chunks = text_splitter.split_documents([langchain_doc])
+            chunks = split_text(doc["page_content"])
             logging.info(f"  Document '{doc['metadata'].get('filename', 'N/A')}' découpé en {len(chunks)} chunks.")
 
             # Enrichit chaque chunk avec des métadonnées supplémentaires
-            for i, chunk in enumerate(chunks):
+            for i, (start_index, text) in enumerate(chunks):
                 chunk_dict = {
                     "id": f"{doc_counter}_{i}", # Identifiant unique du chunk (doc_index_chunk_index)
-                    "text": chunk.page_content,
+                    "text": text,
                     "metadata": {
-                        **chunk.metadata, # Métadonnées héritées du document (source, category, etc.)
-                        "chunk_id_in_doc": i, # Position du chunk dans son document d'origine
-                        "start_index": chunk.metadata.get("start_index", -1) # Position de début (en caractères)
+                        **doc["metadata"], # Métadonnées héritées du document (source, category, etc.)
+                        "start_index": start_index, # Position de début (en caractères)
+                        "chunk_id_in_doc": i # Position du chunk dans son document d'origine
                     }
                 }
                 all_chunks.append(chunk_dict)
@@ -78,8 +262,31 @@ class VectorStoreManager:
         logging.info(f"Total de {len(all_chunks)} chunks créés.")
         return all_chunks
 
+    async def _agenerate_embeddings(self, batches: List[List[str]], max_concurrent: int = EMBEDDING_MAX_CONCURRENT) -> List[any]:
+        """
+        Envoie les lots de textes à l'API d'embedding en parallèle (au plus max_concurrent à la fois).
+
+        Args:
+            batches: Lots de textes à encoder
+            max_concurrent: Nombre maximal de lots envoyés simultanément
+
+        Returns:
+            Pour chaque lot, dans l'ordre: la liste de ses embeddings, ou l'exception levée
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def embed_batch(batch_num: int, texts_to_embed: List[str]) -> List[List[float]]:
+            async with semaphore:
+                logging.info(f"  Traitement du lot {batch_num}/{len(batches)} ({len(texts_to_embed)} chunks)")
+                return await mistral_async.aembeddings(texts_to_embed, model=EMBEDDING_MODEL)
+
+        return await asyncio.gather(
+            *(embed_batch(batch_num, texts) for batch_num, texts in enumerate(batches, start=1)),
+            return_exceptions=True
+        )
+
     def _generate_embeddings(self, chunks: List[Dict[str, any]]) -> Optional[np.ndarray]:
-        """Génère les embeddings pour une liste de chunks via l'API Mistral."""
+        """Génère les embeddings normalisés (L2) d'une liste de chunks via l'API Mistral (lots envoyés en parallèle)."""
         if not MISTRAL_API_KEY:
             logging.error("Impossible de générer les embeddings: MISTRAL_API_KEY manquante.")
             return None
@@ -88,55 +295,52 @@ class VectorStoreManager:
             return None
 
         logging.info(f"Génération des embeddings pour {len(chunks)} chunks (modèle: {EMBEDDING_MODEL})...")
-        all_embeddings = []
-        total_batches = (len(chunks) + EMBEDDING_BATCH_SIZE - 1) // EMBEDDING_BATCH_SIZE
-
-        for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
-            batch_num = (i // EMBEDDING_BATCH_SIZE) + 1
-            batch_chunks = chunks[i:i + EMBEDDING_BATCH_SIZE]
-            texts_to_embed = [chunk["text"] for chunk in batch_chunks]
-
-            logging.info(f"  Traitement du lot {batch_num}/{total_batches} ({len(texts_to_embed)} chunks)")
-            try:
-                response = self.mistral_client.embeddings(
-                    model=EMBEDDING_MODEL,
-                    input=texts_to_embed
-                )
-                batch_embeddings = [data.embedding for data in response.data]
-                all_embeddings.extend(batch_embeddings)
-            except MistralAPIException as e:
-                logging.error(f"Erreur API Mistral lors de la génération d'embeddings (lot {batch_num}): {e}")
-                logging.error(f"  Détails: Status Code={e.status_code}, Message={e.message}")
-            except Exception as e:
-                logging.error(f"Erreur inattendue lors de la génération d'embeddings (lot {batch_num}): {e}")
-                 # Gérer l'erreur: ici on ajoute des vecteurs nuls pour ne pas bloquer
-                num_failed = len(texts_to_embed)
-                if all_embeddings: # Si on a déjà des embeddings, on prend la dimension du premier
-                    dim = len(all_embeddings[0])
-                else: # Sinon, on ne peut pas déterminer la dimension, on saute ce lot
-                     logging.error("Impossible de déterminer la dimension des embeddings, saut du lot.")
-                     continue
-                logging.warning(f"Ajout de {num_failed} vecteurs nuls de dimension {dim} pour le lot échoué.")
-                all_embeddings.extend([np.zeros(dim, dtype='float32')] * num_failed)
-
-            except Exception as e:
-                logging.error(f"Erreur inattendue lors de la génération d'embeddings (lot {batch_num}): {e}")
-                # Gérer comme ci-dessus
-                num_failed = len(texts_to_embed)
-                if all_embeddings:
-                    dim = len(all_embeddings[0])
-                else:
-                     logging.error("Impossible de déterminer la dimension des embeddings, saut du lot.")
-                     continue
-                logging.warning(f"Ajout de {num_failed} vecteurs nuls de dimension {dim} pour le lot échoué.")
-                all_embeddings.extend([np.zeros(dim, dtype='float32')] * num_failed)
-
+        batches = [
+            [chunk["text"] for chunk in chunks[i:i + EMBEDDING_BATCH_SIZE]]
+            for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE)
+        ]
+        # Exécuté sur la boucle partagée de mistral_async (pool de connexions HTTP/2)
+        results = mistral_async.run(self._agenerate_embeddings(batches))
+
+        # Lots échoués malgré les nouvelles tentatives de aembeddings (ex: limite de débit atteinte
+        # par les lots parallèles): une seconde passe les renvoie un par un
+        failed = [i for i, result in enumerate(results) if isinstance(result, BaseException)]
+        if failed:
+            logging.warning(f"{len(failed)} lot(s) d'embeddings en échec, nouvelle tentative séquentielle...")
+            retried = mistral_async.run(self._agenerate_embeddings([batches[i] for i in failed], max_concurrent=1))
+            for i, result in zip(failed, retried):
+                results[i] = result
+
+        # Dimension des embeddings, déduite du premier lot réussi (pour remplacer les lots échoués)
+        dim = next((len(result[0]) for result in results if not isinstance(result, BaseException) and result), None)
+        if dim is None:
+            logging.error("Aucun embedding n'a pu être généré: tous les lots ont échoué.")
+            return None
 
-        if not all_embeddings:
-             logging.error("Aucun embedding n'a pu être généré.")
-             return None
+        # Matrice float32 préallouée, remplie lot par lot (pas de liste intermédiaire de vecteurs)
+        embeddings_array = np.empty((len(chunks), dim), dtype=np.float32)
+        row = 0
+        for batch_num, (texts_to_embed, result) in enumerate(zip(batches, results), start=1):
+            if not isinstance(result, BaseException):
+                block = embeddings_array[row:row + len(result)] # Vue contiguë sur les lignes du lot
+                block[:] = result
+                # Normalisation L2 (similarité cosinus) pendant que le lot est encore en cache,
+                # plutôt qu'une seconde passe sur toute la matrice
+                faiss.normalize_L2(block)
+                row += len(result)
+                continue
+
+            if isinstance(result, MistralAPIException):
+                logging.error(f"Erreur API Mistral lors de la génération d'embeddings (lot {batch_num}): {result}")
+                logging.error(f"  Détails: Status Code={result.http_status}, Message={result.message}")
+            else:
+                logging.error(f"Erreur inattendue lors de la génération d'embeddings (lot {batch_num}): {result}")
+            # Lot échoué: vecteurs nuls, pour garder l'alignement entre chunks et embeddings
+            num_failed = len(texts_to_embed)
+            logging.warning(f"Ajout de {num_failed} vecteurs nuls de dimension {dim} pour les chunks {row} à {row + num_failed - 1} (lot {batch_num}).")
+            embeddings_array[row:row + num_failed] = 0.0
+            row += num_failed
 
-        embeddings_array = np.array(all_embeddings).astype('float32')
         logging.info(f"Embeddings générés avec succès. Shape: {embeddings_array.shape}")
         return embeddings_array
 
@@ -147,57 +351,201 @@ class VectorStoreManager:
             return
 
         # 1. Découper en chunks
-        self.document_chunks = self._split_documents_to_chunks(documents)
-        if not self.document_chunks:
+        chunks = self._split_documents_to_chunks(documents)
+        if not chunks:
             logging.error("Le découpage n'a produit aucun chunk. Impossible de construire l'index.")
             return
 
         # 2. Générer les embeddings
-        embeddings = self._generate_embeddings(self.document_chunks)
-        if embeddings is None or embeddings.shape[0] != len(self.document_chunks):
+        embeddings = self._generate_embeddings(chunks)
+        if embeddings is None or embeddings.shape[0] != len(chunks):
             logging.error("Problème de génération d'embeddings. Le nombre d'embeddings ne correspond pas au nombre de chunks.")
-            # Nettoyer pour éviter un état incohérent
-            self.document_chunks = []
-            self.index = None
-            # Supprimer les fichiers potentiellement corrompus
-            if os.path.exists(FAISS_INDEX_FILE): os.remove(FAISS_INDEX_FILE)
-            if os.path.exists(DOCUMENT_CHUNKS_FILE): os.remove(DOCUMENT_CHUNKS_FILE)
+            # L'index et les chunks existants (en mémoire et sur disque) sont conservés tels quels
+            logging.error("Construction abandonnée: l'index existant est conservé.")
             return
 
-
         # 3. Créer l'index Faiss optimisé pour la similarité cosinus
         dimension = embeddings.shape[1]
         logging.info(f"Création de l'index Faiss optimisé pour la similarité cosinus avec dimension {dimension}...")
 
-        # Normaliser les embeddings pour la similarité cosinus
-        faiss.normalize_L2(embeddings)
-
-        # Créer un index pour la similarité cosinus (IndexFlatIP = produit scalaire)
-        self.index = faiss.IndexFlatIP(dimension)
-        self.index.add(embeddings)
+        # Les embeddings sont déjà normalisés lot par lot dans _generate_embeddings
+        previous_index, previous_chunks = self.index, self.document_chunks
+        try:
+            self.index = self._create_index(embeddings)
+            # Stockage en colonnes des chunks indexés (métadonnées communes partagées par document)
+            self.document_chunks = ChunkColumns.from_dicts(chunks)
+            self._configure_index()
+        except Exception as e:
+            logging.error(f"Erreur lors de la création de l'index: {e}. L'index existant est conservé.")
+            self.index, self.document_chunks = previous_index, previous_chunks
+            return
         logging.info(f"Index Faiss créé avec {self.index.ntotal} vecteurs.")
 
-        # 4. Sauvegarder l'index et les chunks
-        self._save_index_and_chunks()
+        # 4. Sauvegarder l'index, les chunks et les embeddings normalisés
+        # (ces derniers permettent de reconstruire l'index sans appel à l'API)
+        self._save_index_and_chunks(embeddings)
 
-    def _save_index_and_chunks(self):
-        """Sauvegarde l'index Faiss et la liste des chunks."""
+    def rebuild_index(self, index_factory: Optional[str] = None) -> bool:
+        """
+        Reconstruit l'index Faiss à partir des embeddings sauvegardés, sans appel à l'API.
+
+        Permet de changer de type d'index (IVF, PQ, HNSW...) sans regénérer les embeddings.
+        Le fichier d'embeddings est projeté en mémoire (mmap): il n'est pas chargé en entier.
+
+        Args:
+            index_factory: Description Faiss de l'index (ex: "IVF1024,PQ64", "HNSW32").
+                           Par défaut, même choix automatique que build_index.
+
+        Returns:
+            True si l'index a été reconstruit et sauvegardé
+        """
+        if not os.path.exists(EMBEDDINGS_FILE):
+            logging.error(f"Reconstruction impossible: fichier d'embeddings {EMBEDDINGS_FILE} introuvable (relancez l'indexation).")
+            return False
+
+        embeddings = np.load(EMBEDDINGS_FILE, mmap_mode='r')
+        if embeddings.shape[0] != len(self.document_chunks):
+            logging.error(f"Reconstruction impossible: {embeddings.shape[0]} embeddings pour {len(self.document_chunks)} chunks.")
+            return False
+
+        try:
+            if index_factory is None:
+                index = self._create_index(np.ascontiguousarray(embeddings))
+            else:
+                logging.info(f"Construction d'un index '{index_factory}' sur {embeddings.shape[0]} vecteurs...")
+                index = faiss.index_factory(embeddings.shape[1], index_factory, faiss.METRIC_INNER_PRODUCT)
+                # Échantillon régulier d'au plus 200 000 vecteurs pour l'entraînement
+                step = max(1, embeddings.shape[0] // 200_000)
+                training = np.ascontiguousarray(embeddings[::step]) if not index.is_trained else None
+                index = train_and_add(index, np.ascontiguousarray(embeddings), training)
+            self.index = index
+            self._configure_index()
+            # Écriture dans un fichier temporaire puis renommage: un index déjà projeté en mémoire
+            # (par ce processus ou par l'application) continue de pointer vers l'ancien fichier
+            tmp_file = FAISS_INDEX_FILE + ".tmp"
+            faiss.write_index(self.index, tmp_file)
+            os.replace(tmp_file, FAISS_INDEX_FILE)
+            logging.info(f"Index Faiss reconstruit ({type(self.index).__name__}, {self.index.ntotal} vecteurs) et sauvegardé.")
+            return True
+        except Exception as e:
+            logging.error(f"Erreur lors de la reconstruction de l'index: {e}")
+            return False
+
+    def _save_index_and_chunks(self, embeddings: Optional[np.ndarray] = None):
+        """
+        Sauvegarde l'index Faiss, la liste des chunks et, si fournis, les embeddings.
+
+        Tous les fichiers sont d'abord écrits en .tmp, puis renommés seulement si toutes les
+        écritures ont réussi: en cas d'erreur, les fichiers en place restent intacts.
+        """
         if self.index is None or not self.document_chunks:
             logging.warning("Tentative de sauvegarde d'un index ou de chunks vides.")
             return
 
         os.makedirs(os.path.dirname(FAISS_INDEX_FILE), exist_ok=True)
         os.makedirs(os.path.dirname(DOCUMENT_CHUNKS_FILE), exist_ok=True)
+        os.makedirs(os.path.dirname(EMBEDDINGS_FILE), exist_ok=True)
 
+        targets = [FAISS_INDEX_FILE, DOCUMENT_CHUNKS_FILE] + ([EMBEDDINGS_FILE] if embeddings is not None else [])
         try:
             logging.info(f"Sauvegarde de l'index Faiss dans {FAISS_INDEX_FILE}...")
-            faiss.write_index(self.index, FAISS_INDEX_FILE)
+            faiss.write_index(self.index, FAISS_INDEX_FILE + ".tmp")
             logging.info(f"Sauvegarde des chunks dans {DOCUMENT_CHUNKS_FILE}...")
-            with open(DOCUMENT_CHUNKS_FILE, 'wb') as f:
-                pickle.dump(self.document_chunks, f)
-            logging.info("Index et chunks sauvegardés avec succès.")
+            with open(DOCUMENT_CHUNKS_FILE + ".tmp", 'wb') as f:
+                # JSON Lines via orjson: un chunk par ligne, écrit au fil de l'eau sans liste intermédiaire
+                for chunk in self.document_chunks:
+                    f.write(orjson.dumps(chunk, option=orjson.OPT_APPEND_NEWLINE))
+            if embeddings is not None:
+                logging.info(f"Sauvegarde des embeddings dans {EMBEDDINGS_FILE}...")
+                # Objet fichier: np.save n'ajoute pas d'extension .npy au nom temporaire
+                with open(EMBEDDINGS_FILE + ".tmp", 'wb') as f:
+                    np.save(f, embeddings)
+        except Exception as e:
+            logging.error(f"Erreur lors de la sauvegarde de l'index/chunks: {e}. Fichiers existants conservés.")
+            for target in targets:
+                if os.path.exists(target + ".tmp"):
+                    os.remove(target + ".tmp")
+            return
+
+        # Renommages atomiques: un index déjà projeté en mémoire continue de pointer vers l'ancien fichier
+        for target in targets:
+            os.replace(target + ".tmp", target)
+        logging.info("Index et chunks sauvegardés avec succès.")
+
+    async def aembed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Génère les embeddings normalisés d'une liste de textes (version asynchrone).
+
+        Utilise le pool de connexions HTTP/2 partagé de utils.mistral_async.
+
+        Args:
+            texts: Textes à encoder (un seul appel à l'API)
+
+        Returns:
+            Embeddings de shape (len(texts), d) normalisés pour la similarité cosinus
+        """
+        embeddings = await mistral_async.aembeddings(texts, model=EMBEDDING_MODEL)
+        # Conversion directe en float32 contigu (une seule allocation)
+        embeddings_array = np.asarray(embeddings, dtype=np.float32)
+
+        # Normaliser les embeddings pour la similarité cosinus
+        faiss.normalize_L2(embeddings_array)
+        return embeddings_array
+
+    def embed_texts(self, texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Génère les embeddings normalisés d'une liste de textes.
+
+        Les embeddings déjà calculés sont servis depuis un cache LRU (QUERY_EMBEDDING_CACHE_SIZE
+        entrées): seuls les textes absents du cache sont envoyés à l'API, en un seul appel.
+
+        Args:
+            texts: Textes à encoder
+
+        Returns:
+            Embeddings de shape (len(texts), d) normalisés pour la similarité cosinus, ou None en cas d'erreur
+        """
+        with self._embedding_cache_lock:
+            found = {}
+            for text in texts:
+                if text in self._embedding_cache:
+                    self._embedding_cache.move_to_end(text)
+                    found[text] = self._embedding_cache[text]
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        if not missing:
+            return np.vstack([found[text] for text in texts])
+
+        if not MISTRAL_API_KEY:
+            logging.error("Embedding impossible: MISTRAL_API_KEY manquante.")
+            return None
+        try:
+            embeddings = mistral_async.run(self.aembed_texts(missing))
+            with self._embedding_cache_lock:
+                for text, embedding in zip(missing, embeddings):
+                    found[text] = self._embedding_cache[text] = embedding
+                while len(self._embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+            # Nouvelle matrice: les vecteurs du cache ne sont jamais exposés directement
+            return np.vstack([found[text] for text in texts])
+        except MistralAPIException as e:
+            logging.error(f"Erreur API Mistral lors de la génération des embeddings: {e}")
+            logging.error(f"  Détails: Status Code={e.http_status}, Message={e.message}")
+            return None
         except Exception as e:
-            logging.error(f"Erreur lors de la sauvegarde de l'index/chunks: {e}")
+            logging.error(f"Erreur inattendue lors de la génération des embeddings: {e}")
+            return None
+
+    def embed_query(self, query_text: str) -> Optional[np.ndarray]:
+        """
+        Génère l'embedding normalisé d'une requête.
+
+        Args:
+            query_text: Texte de la requête
+
+        Returns:
+            Embedding de shape (1, d) normalisé pour la similarité cosinus, ou None en cas d'erreur
+        """
+        return self.embed_texts([query_text])
 
     def search(self, query_text: str, k: int = 5, min_score: float = None) -> List[Dict[str, any]]:
         """
@@ -211,79 +559,188 @@ class VectorStoreManager:
         Returns:
             Liste des chunks pertinents avec leurs scores
         """
+        return self.search_batch([query_text], k=k, min_score=min_score)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5, min_score: float = None) -> List[List[Dict[str, any]]]:
+        """
+        Recherche les k chunks les plus pertinents pour plusieurs requêtes à la fois.
+
+        Les requêtes sont encodées en un seul appel à l'API, puis recherchées en un seul
+        appel à index.search sur une matrice (nq, d).
+
+        Args:
+            queries: Textes des requêtes
+            k: Nombre de résultats à retourner par requête
+            min_score: Score minimum (entre 0 et 1) pour inclure un résultat
+
+        Returns:
+            Pour chaque requête, dans l'ordre, la liste des chunks pertinents avec leurs scores
+        """
         if self.index is None or not self.document_chunks:
             logging.warning("Recherche impossible: l'index Faiss n'est pas chargé ou est vide.")
-            return []
+            return [[] for _ in queries]
         if not MISTRAL_API_KEY:
              logging.error("Recherche impossible: MISTRAL_API_KEY manquante pour générer l'embedding de la requête.")
-             return []
+             return [[] for _ in queries]
+
+        logging.info(f"Recherche des {k} chunks les plus pertinents pour {len(queries)} requête(s): {queries}")
+        # 1. Générer les embeddings des requêtes (un seul appel à l'API)
+        query_embeddings = self.embed_texts(queries)
+        if query_embeddings is None:
+            return [[] for _ in queries]
+
+        # 2. Rechercher dans l'index Faiss à partir des embeddings
+        return self.search_batch_by_embedding(query_embeddings, k=k, min_score=min_score)
+
+    def search_by_embedding(self, query_embedding: np.ndarray, k: int = 5, min_score: float = None) -> List[Dict[str, any]]:
+        """
+        Recherche les k chunks les plus pertinents à partir de l'embedding d'une requête.
+
+        Permet de réutiliser un embedding déjà calculé (voir embed_query) sans nouvel appel à l'API.
+
+        Args:
+            query_embedding: Embedding normalisé de la requête (shape (1, d))
+            k: Nombre de résultats à retourner
+            min_score: Score minimum (entre 0 et 1) pour inclure un résultat
+
+        Returns:
+            Liste des chunks pertinents avec leurs scores
+        """
+        return self.search_batch_by_embedding(query_embedding, k=k, min_score=min_score)[0]
+
+    def search_batch_by_embedding(self, query_embeddings: np.ndarray, k: int = 5, min_score: float = None) -> List[List[Dict[str, any]]]:
+        """
+        Recherche les k chunks les plus pertinents pour une matrice d'embeddings, en un seul appel Faiss.
+
+        Args:
+            query_embeddings: Embeddings normalisés des requêtes (shape (nq, d))
+            k: Nombre de résultats à retourner par requête
+            min_score: Score minimum (entre 0 et 1) pour inclure un résultat
+
+        Returns:
+            Pour chaque requête, dans l'ordre, la liste des chunks pertinents avec leurs scores
+        """
+        query_embeddings = as_faiss_queries(query_embeddings)
+        if self.index is None or not self.document_chunks:
+            logging.warning("Recherche impossible: l'index Faiss n'est pas chargé ou est vide.")
+            return [[] for _ in range(len(query_embeddings))]
 
-        logging.info(f"Recherche des {k} chunks les plus pertinents pour: '{query_text}'")
         try:
-            # 1. Générer l'embedding de la requête
-            response = self.mistral_client.embeddings(
-                model=EMBEDDING_MODEL,
-                input=[query_text] # La requête doit être une liste
-            )
-            query_embedding = np.array([response.data[0].embedding]).astype('float32')
-
-            # Normaliser l'embedding de la requête pour la similarité cosinus
-            faiss.normalize_L2(query_embedding)
-
-            # 2. Rechercher dans l'index Faiss
-            # Pour IndexFlatIP: scores = produit scalaire (plus grand = meilleur)
+            # Pour les index en produit scalaire (Flat, SQ, IVF, HNSW): plus grand = meilleur
             # indices: index des chunks correspondants dans self.document_chunks
             # Demander plus de résultats si un score minimum est spécifié
             search_k = k * 3 if min_score is not None else k
-            scores, indices = self.index.search(query_embedding, search_k)
-
-            # 3. Formater les résultats
-            results = []
-            if indices.size > 0: # Vérifier s'il y a des résultats
-                for i, idx in enumerate(indices[0]):
-                    if 0 <= idx < len(self.document_chunks): # Vérifier la validité de l'index
-                        chunk = self.document_chunks[idx]
-                        # Convertir le score en similarité (0-1)
-                        # Pour IndexFlatIP avec vecteurs normalisés, le score est déjà entre -1 et 1
-                        # On le convertit en pourcentage (0-100%)
-                        raw_score = float(scores[0][i])
-                        similarity = raw_score * 100
-
-                        # Filtrer les résultats en fonction du score minimum
-                        # Le min_score est entre 0 et 1, mais similarity est en pourcentage (0-100)
-                        min_score_percent = min_score * 100 if min_score is not None else 0
-                        if min_score is not None and similarity < min_score_percent:
-                            logging.debug(f"Document filtré (score {similarity:.2f}% < minimum {min_score_percent:.2f}%)")
-                            continue
-
-                        results.append({
-                            "score": similarity, # Score de similarité en pourcentage
-                            "raw_score": raw_score, # Score brut pour débogage
-                            "text": chunk["text"],
-                            "metadata": chunk["metadata"] # Contient source, category, chunk_id_in_doc, start_index etc.
-                        })
-                    else:
-                        logging.warning(f"Index Faiss {idx} hors limites (taille des chunks: {len(self.document_chunks)}).")
-
-            # Trier par score (similarité la plus élevée en premier)
-            results.sort(key=lambda x: x["score"], reverse=True)
-
-            # Limiter au nombre demandé (k) si nécessaire
-            if len(results) > k:
-                results = results[:k]
-
-            if min_score is not None:
-                min_score_percent = min_score * 100
-                logging.info(f"{len(results)} chunks pertinents trouvés (score minimum: {min_score_percent:.2f}%).")
-            else:
-                logging.info(f"{len(results)} chunks pertinents trouvés.")
+            scores, indices = self.index.search(query_embeddings, search_k)
 
-            return results
+            # Formater les résultats, ligne par ligne
+            return [self.format_results(scores[row], indices[row], k, min_score) for row in range(len(query_embeddings))]
 
-        except MistralAPIException as e:
-            logging.error(f"Erreur API Mistral lors de la génération de l'embedding de la requête: {e}")
-            logging.error(f"  Détails: Status Code={e.status_code}, Message={e.message}")
-            return []
         except Exception as e:
             logging.error(f"Erreur inattendue lors de la recherche: {e}")
-            return []
\ No newline at end of file
+            return [[] for _ in range(len(query_embeddings))]
+
+    def cheap_probe(self, query_embedding: np.ndarray) -> float:
+        """
+        Sonde rapide de l'index: retourne le score brut du meilleur chunk (k=1).
+
+        Pour un index IVF, une seule liste est explorée (nprobe=1). Permet d'éviter la
+        recherche complète lorsqu'aucun chunk n'atteint le score minimum.
+
+        Args:
+            query_embedding: Embedding normalisé de la requête (shape (1, d))
+
+        Returns:
+            Score brut (entre -1 et 1) du meilleur chunk, -1.0 si l'index est vide,
+            ou 1.0 (pas de sonde) si l'index n'est pas de type IVF
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return -1.0
+        # Sans IVF, la sonde coûterait autant que la recherche complète: celle-ci est lancée directement
+        if faiss.try_extract_index_ivf(self.index) is None:
+            return 1.0
+        try:
+            # Paramètres passés à l'appel plutôt que index.nprobe: l'index est partagé entre threads
+            params = faiss.SearchParametersIVF(nprobe=1)
+            scores, indices = self.index.search(as_faiss_queries(query_embedding), 1, params=params)
+            return float(scores[0][0]) if indices[0][0] >= 0 else -1.0
+        except Exception as e:
+            logging.warning(f"Erreur lors de la sonde rapide de l'index: {e}")
+            # En cas de doute, ne pas empêcher la recherche complète
+            return 1.0
+
+    def format_results(self, scores: np.ndarray, indices: np.ndarray, k: int, min_score: float = None) -> List[Dict[str, any]]:
+        """
+        Convertit une ligne de résultats Faiss (scores, indices) en liste de chunks.
+
+        Args:
+            scores: Scores retournés par index.search pour une requête (shape (search_k,))
+            indices: Indices retournés par index.search pour une requête (shape (search_k,))
+            k: Nombre de résultats à retourner
+            min_score: Score minimum (entre 0 et 1) pour inclure un résultat
+
+        Returns:
+            Liste des chunks pertinents avec leurs scores
+        """
+        # Filtrage vectorisé: indices valides (-1 = pas de résultat), puis score minimum
+        indices = np.asarray(indices)
+        out_of_bounds = indices >= len(self.document_chunks)
+        if out_of_bounds.any():
+            logging.warning(f"Index Faiss {indices[out_of_bounds].tolist()} hors limites (taille des chunks: {len(self.document_chunks)}).")
+        keep = (indices >= 0) & ~out_of_bounds
+        indices = indices[keep]
+        raw_scores = np.asarray(scores, dtype=np.float64)[keep]
+
+        # Convertir le score en similarité (0-100%)
+        # Pour un index en produit scalaire avec vecteurs normalisés, le score brut est entre -1 et 1
+        similarities = raw_scores * 100.0
+
+        # Filtrer les résultats en fonction du score minimum
+        # Le min_score est entre 0 et 1, mais similarity est en pourcentage (0-100)
+        if min_score is not None:
+            above = similarities >= min_score * 100
+            logging.debug(f"{int((~above).sum())} document(s) filtré(s) (score < minimum {min_score * 100:.2f}%)")
+            indices, raw_scores, similarities = indices[above], raw_scores[above], similarities[above]
+
+        # Garder les k meilleurs scores, triés par similarité décroissante
+        order = np.argsort(-similarities, kind="stable")
+        if len(similarities) > k:
+            top = np.argpartition(-similarities, k - 1)[:k]
+            order = top[np.argsort(-similarities[top], kind="stable")]
+
+        # Les dictionnaires de résultat ne sont construits que pour les chunks retenus
+        results = []
+        for i in order:
+            idx = int(indices[i])
+            results.append({
+                "score": float(similarities[i]), # Score de similarité en pourcentage
+                "raw_score": float(raw_scores[i]), # Score brut pour débogage
+                "text": self.document_chunks.texts[idx],
+                "metadata": self.document_chunks.metadata(idx), # Contient source, category, chunk_id_in_doc, start_index etc.
+                "chunk_index": idx # Position du chunk dans l'index (permet de retrouver son embedding)
+            })
+
+        if min_score is not None:
+            min_score_percent = min_score * 100
+            logging.info(f"{len(results)} chunks pertinents trouvés (score minimum: {min_score_percent:.2f}%).")
+        else:
+            logging.info(f"{len(results)} chunks pertinents trouvés.")
+
+        return results
+
+    def get_chunk_embeddings(self, chunk_indices: List[int]) -> Optional[np.ndarray]:
+        """
+        Récupère les embeddings (normalisés) de chunks déjà indexés, sans appel à l'API.
+
+        Args:
+            chunk_indices: Positions des chunks dans l'index Faiss
+
+        Returns:
+            Matrice de shape (len(chunk_indices), d), ou None si l'index ne permet pas la reconstruction
+        """
+        if self.index is None or not chunk_indices:
+            return None
+        try:
+            return self.index.reconstruct_batch(np.asarray(chunk_indices, dtype='int64'))
+        except Exception as e:
+            logging.warning(f"Impossible de reconstruire les embeddings des chunks: {e}")
+            return None